@@ -0,0 +1,29 @@
+'''Tiles per second for decoding a full 256-tile CHR bank, per-tile vs whole-bank.
+
+Run from the repository root: python -m benchmarks.chr_decode [path/to/bg.chr]'''
+import os, sys, timeit
+import numpy as np
+from src.twobpp import convert_tile_from_bitplanes, convert_tiles_from_bitplanes
+
+def per_tile(gfx):
+    return [convert_tile_from_bitplanes(gfx[i*0x10:i*0x10+0x10]) for i in range(len(gfx)//0x10)]
+
+def whole_bank(gfx):
+    return convert_tiles_from_bitplanes(gfx)
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        with open(sys.argv[1], 'rb') as f:
+            gfx = bytearray(f.read())
+    else:
+        gfx = bytearray(os.urandom(0x1000))
+    num_tiles = len(gfx)//0x10
+
+    assert np.array_equal(np.stack(per_tile(gfx)), whole_bank(gfx))
+    tiles = whole_bank(gfx)
+    assert np.array_equal(convert_tiles_from_bitplanes(gfx, h_flip=True), tiles[:, :, ::-1])
+    assert np.array_equal(convert_tiles_from_bitplanes(gfx, v_flip=True), tiles[:, ::-1, :])
+
+    for name, func in (('per tile', per_tile), ('whole bank', whole_bank)):
+        loops, total = timeit.Timer(lambda: func(gfx)).autorange()
+        print(f'{name:>10}: {num_tiles*loops/total:12,.0f} tiles/s')
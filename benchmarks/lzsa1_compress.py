@@ -0,0 +1,53 @@
+'''Throughput and ratio of the built-in LZSA1 compressor on every room of a project,
+compared against the lzsa executable if one is found.
+
+Run from the repository root: python -m benchmarks.lzsa1_compress path/to/data [path/to/lzsa]'''
+import json, os, subprocess, sys, tempfile, time
+from src import lzsa1
+from src.obj_codec import ObjCodec
+from src.to_asm import room_2_bytes
+
+def load_rooms(folder_path):
+    with open(os.path.join(folder_path, 'area_names.json'), 'r') as f:
+        area_names = json.load(f)
+    with open(os.path.join(folder_path, 'local_obj_types.json'), 'r') as f:
+        local_obj_codec = ObjCodec(json.load(f))
+
+    rooms = []
+    for area in area_names:
+        with open(os.path.join(folder_path, f'{area}/rooms.json'), 'r') as f:
+            rooms.extend(bytes(room_2_bytes(room, local_obj_codec)) for room in json.load(f))
+    return rooms
+
+def compress_external(lzsa_path, room):
+    with tempfile.TemporaryDirectory() as tmp:
+        in_path = os.path.join(tmp, 'room')
+        out_path = os.path.join(tmp, 'room.bin')
+        with open(in_path, 'wb') as f:
+            f.write(room)
+        subprocess.run([lzsa_path, '-f', '1', '-r', in_path, out_path], check=True, stdout=subprocess.DEVNULL)
+        with open(out_path, 'rb') as f:
+            return f.read()
+
+def report(name, rooms, compressed, seconds):
+    size_in = sum(len(room) for room in rooms)
+    size_out = sum(len(block) for block in compressed)
+    print(f'{name:>8}: {len(rooms)} rooms, {size_in} -> {size_out} bytes (ratio {size_out/size_in:.3f}), {size_in/seconds/1024:,.1f} KB/s, {seconds*1000:.0f} ms')
+
+if __name__ == '__main__':
+    rooms = load_rooms(sys.argv[1])
+    lzsa_path = sys.argv[2] if len(sys.argv) >= 3 else './lzsa'
+
+    start = time.perf_counter()
+    compressed = [lzsa1.compress(room) for room in rooms]
+    report('built-in', rooms, compressed, time.perf_counter()-start)
+    assert all(lzsa1.decompress(block) == room for room, block in zip(rooms, compressed))
+
+    if os.path.exists(lzsa_path):
+        start = time.perf_counter()
+        reference = [compress_external(lzsa_path, room) for room in rooms]
+        report('lzsa', rooms, reference, time.perf_counter()-start)
+        assert all(lzsa1.decompress(block) == room for room, block in zip(rooms, reference))
+        print(f'{sum(a == b for a, b in zip(compressed, reference))}/{len(rooms)} rooms byte-for-byte identical')
+    else:
+        print(f'{lzsa_path} not found, skipping the comparison')
@@ -0,0 +1,68 @@
+'''Encoding and decoding speed of the compiled object codec against searching the object types for every object,
+on random objects of every type of a project's local_obj_types.json and global_obj_types.json.
+
+Run from the repository root: python -m benchmarks.obj_codec path/to/data [number of objects]'''
+import json, os, random, sys, time
+from src.obj_codec import ObjCodec
+
+def scan_decode(data, obj_types):
+    for k, v in obj_types.items():
+        if v['type'] == data[0] & 0xF:
+            obj_type = k
+
+    props = {}
+    for param_i, param in enumerate(data):
+        for prop_name, info in obj_types[obj_type]['props'][param_i].items():
+            props[prop_name] = (param >> info['shifts']) % (1 << info['len'])
+    return obj_type, props
+
+def scan_encode(obj, obj_types):
+    out = []
+    for byte_i, types_in_byte in enumerate(obj_types[obj['obj_type']]['props']):
+        b = obj_types[obj['obj_type']]['type'] if byte_i == 0 else 0
+        for prop_name, info in types_in_byte.items():
+            if prop_name == 'x' or prop_name == 'y':
+                b |= ((obj[prop_name] & 0xFF) >> (8 - info['len'])) << info['shifts']
+            else:
+                b |= obj[prop_name] << info['shifts']
+        out.append(b)
+    return out
+
+def random_objs(obj_types, n, rng):
+    objs = []
+    for _ in range(n):
+        obj_type = rng.choice(list(obj_types))
+        obj = {'obj_type': obj_type, 'x': rng.randrange(0x100), 'y': rng.randrange(0x100)}
+        for props_in_byte in obj_types[obj_type]['props']:
+            for prop_name, prop in props_in_byte.items():
+                if prop_name != 'x' and prop_name != 'y':
+                    obj[prop_name] = rng.randrange(1 << prop['len'])
+        objs.append(obj)
+    return objs
+
+def timed(f):
+    start = time.perf_counter()
+    out = f()
+    return out, time.perf_counter()-start
+
+def report(name, n, scan_seconds, codec_seconds):
+    print(f'{name:>23}: {n} objects, scan {scan_seconds*1000:.1f} ms, codec {codec_seconds*1000:.1f} ms ({scan_seconds/codec_seconds:.1f}x)')
+
+if __name__ == '__main__':
+    n = int(sys.argv[2]) if len(sys.argv) >= 3 else 5000
+    rng = random.Random(0)
+    for name in ('local_obj_types', 'global_obj_types'):
+        with open(os.path.join(sys.argv[1], f'{name}.json'), 'r') as f:
+            obj_types = json.load(f)
+        codec = ObjCodec(obj_types)
+        objs = random_objs(obj_types, n, rng)
+
+        scanned, scan_seconds = timed(lambda: [scan_encode(obj, obj_types) for obj in objs])
+        encoded, codec_seconds = timed(lambda: [codec.encode(obj) for obj in objs])
+        assert encoded == scanned
+        report(f'{name} encode', n, scan_seconds, codec_seconds)
+
+        scanned, scan_seconds = timed(lambda: [scan_decode(data, obj_types) for data in encoded])
+        decoded, codec_seconds = timed(lambda: [codec.decode(data) for data in encoded])
+        assert decoded == scanned
+        report(f'{name} decode', n, scan_seconds, codec_seconds)
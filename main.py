@@ -1,9 +1,11 @@
-from PySide6.QtWidgets import QApplication, QFileDialog
 import sys
-from src.main_window import MainWindow
-from src.main_application import MainApplication
 
 if __name__ == '__main__':
+    # Imported here so room compression worker processes, which import this file as well, don't start Qt
+    from PySide6.QtWidgets import QFileDialog
+    from src.main_window import MainWindow
+    from src.main_application import MainApplication
+
     if len(sys.argv) >= 2:
         window = MainWindow(sys.argv[1])
         window.show()
@@ -0,0 +1,70 @@
+import os
+
+class DirtyState:
+    '''What was edited since the last save: the world map, artifacts of each area
+    ('palettes', 'metatiles', 'rooms', 'global_objs') and individual rooms'''
+    def __init__(self):
+        self.world_map = False
+        self.artifacts = {}
+        self.rooms = {}
+
+    def __bool__(self):
+        return self.world_map or any(self.artifacts.values())
+
+    def mark_world_map(self):
+        self.world_map = True
+
+    def mark(self, area, artifact):
+        self.artifacts.setdefault(area, set()).add(artifact)
+
+    def mark_room(self, area, room_idx):
+        self.mark(area, 'rooms')
+        self.rooms.setdefault(area, set()).add(room_idx)
+
+    def is_dirty(self, area, artifact):
+        return artifact in self.artifacts.get(area, ())
+
+    def dirty_rooms(self, area):
+        return sorted(self.rooms.get(area, ()))
+
+    def clear(self):
+        self.world_map = False
+        self.artifacts.clear()
+        self.rooms.clear()
+
+def write_if_changed(path, data):
+    '''Writes data to path, in text mode if it's a str, unless the file already has exactly that content.
+    Returns whether the file was written'''
+    binary = '' if isinstance(data, str) else 'b'
+    try:
+        with open(path, 'r'+binary) as f:
+            if f.read() == data:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    with open(path, 'w'+binary) as f:
+        f.write(data)
+    return True
+
+def stream_if_changed(path, chunks):
+    '''Same as write_if_changed(path, ''.join(chunks)) for str chunks, but the chunks are compared with the file as they come
+    and then streamed into it through a .part file, without joining them first'''
+    chunks = iter(chunks)
+    read = []
+    try:
+        with open(path, 'r') as f:
+            for chunk in chunks:
+                read.append(chunk)
+                if f.read(len(chunk)) != chunk:
+                    break
+            else:
+                if not f.read(1):
+                    return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
+    with open(path+'.part', 'w') as f:
+        f.writelines(read)
+        f.writelines(chunks)
+    os.replace(path+'.part', path)
+    return True
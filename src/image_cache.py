@@ -0,0 +1,148 @@
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QPixmap
+from src.pal_utils import strings_to_color_table
+from src.twobpp import convert_tiles_from_bitplanes, compose_tiles, pixels_2_qimage, tiles_2_qimage
+import numpy as np
+
+class MetatileImageCache:
+    '''Metatile images shared by all editor windows, keyed by (area, palette index, metatile).
+    Images are generated the first time they're needed, along with a pixmap copy for painting'''
+
+    def __init__(self, gfx, pals, metatile_data):
+        # Dicts keyed by area, owned by MainWindow
+        self.gfx = gfx
+        self.pals = pals
+        self.metatile_data = metatile_data
+
+        self.tiles = {}
+        self.color_tables = {}
+        self.images = {}
+        self.pixmaps = {}
+
+    def image(self, area, pal_idx, mt_idx):
+        image = self.images.get((area, pal_idx, mt_idx))
+        if image is None:
+            mts = self.metatile_data[area]
+            image = tiles_2_qimage(self.area_tiles(area), self.color_table(area), width=2, idxs=mts[mt_idx*4:mt_idx*4+4], pal_per_tile=pal_idx)
+            self.images[(area, pal_idx, mt_idx)] = image
+        return image
+
+    def pixmap(self, area, pal_idx, mt_idx):
+        '''Device-ready copy of image(), so painting doesn't convert from Indexed8 on every draw'''
+        pixmap = self.pixmaps.get((area, pal_idx, mt_idx))
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(self.image(area, pal_idx, mt_idx))
+            self.pixmaps[(area, pal_idx, mt_idx)] = pixmap
+        return pixmap
+
+    def area_tiles(self, area):
+        if area not in self.tiles:
+            self.tiles[area] = convert_tiles_from_bitplanes(self.gfx[area])
+        return self.tiles[area]
+
+    def color_table(self, area):
+        if area not in self.color_tables:
+            self.color_tables[area] = strings_to_color_table(self.pals[area][0], 'src/palette.pal', transparent=False)
+        return self.color_tables[area]
+
+    def metatile_edited(self, area, mt_idx):
+        for pal_idx in range(4):
+            self.images.pop((area, pal_idx, mt_idx), None)
+            self.pixmaps.pop((area, pal_idx, mt_idx), None)
+
+    def colors_changed(self, area):
+        '''Recolors the area's images by swapping their color table, keeping the pixels.
+        Returns whether any color actually changed'''
+        old_color_table = self.color_tables.pop(area, None)
+        color_table = self.color_table(area)
+        if color_table == old_color_table:
+            return False
+
+        for (image_area, pal_idx, mt_idx), image in self.images.items():
+            if image_area == area:
+                image.setColorTable(color_table)
+        for key in [key for key in self.pixmaps if key[0] == area]:
+            del self.pixmaps[key]
+        return True
+
+class RoomImageCache:
+    '''Fully composed 256x240 room images, keyed by (area, room), so a room costs one blit to draw.
+    Tiles and colors come from the area's MetatileImageCache.
+    Zoomed out views use mipmaps: pixmap level n is the room scaled down by 2**n, made on first use'''
+
+    MIP_LEVELS = 4
+
+    def __init__(self, mt_images, rooms_data):
+        self.mt_images = mt_images
+        self.rooms_data = rooms_data # dict keyed by area, owned by MainWindow
+
+        self.pixels = {}
+        self.images = {}
+        self.pixmaps = {}
+
+    def pixmap(self, area, room_idx, level=0):
+        mipmaps = self.pixmaps.get((area, room_idx))
+        if mipmaps is None:
+            mipmaps = [QPixmap.fromImage(self.image(area, room_idx))]
+            self.pixmaps[(area, room_idx)] = mipmaps
+        while len(mipmaps) <= level:
+            larger = mipmaps[-1]
+            mipmaps.append(larger.scaled(larger.width()//2, larger.height()//2, Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        return mipmaps[level]
+
+    @staticmethod
+    def mip_level(scale):
+        '''Smallest mipmap that still has at least one pixel per device pixel at the given view scale'''
+        level = 0
+        while level < RoomImageCache.MIP_LEVELS-1 and scale <= 0.5**(level+1):
+            level += 1
+        return level
+
+    def image(self, area, room_idx):
+        image = self.images.get((area, room_idx))
+        if image is None:
+            pixels = self.compose_room(area, room_idx)
+            image = pixels_2_qimage(pixels, self.mt_images.color_table(area))
+            self.pixels[(area, room_idx)] = pixels
+            self.images[(area, room_idx)] = image
+        return image
+
+    def compose_room(self, area, room_idx):
+        room = self.rooms_data[area][room_idx]
+        tm = np.asarray(room['tilemap'], dtype=np.intp).reshape(0xF, 0x10)
+        attrs = np.asarray(room['attrs'][:0xF0], dtype=np.uint8).reshape(0xF, 0x10)
+        mts = np.asarray(self.mt_images.metatile_data[area], dtype=np.intp).reshape(0x100, 2, 2)
+
+        # (row, col, tile row, tile col) -> (row, tile row, col, tile col), i.e. 0x20 tiles per line
+        idxs = mts[tm].swapaxes(1, 2)
+        pals = np.broadcast_to(attrs[:, np.newaxis, :, np.newaxis], idxs.shape)
+        return compose_tiles(self.mt_images.area_tiles(area), 0x20, idxs.ravel(), pals.ravel())
+
+    def cell_edited(self, area, room_idx, x, y):
+        '''Redraws the metatile at pixel (x, y) of a cached room'''
+        if (area, room_idx) in self.pixels:
+            self.draw_cell(area, room_idx, x//0x10+y//0x10*0x10)
+            self.pixmaps.pop((area, room_idx), None)
+
+    def metatile_edited(self, area, usages):
+        '''Redraws the (room, cell) pairs using an edited metatile in the area's cached rooms'''
+        for room_idx, mt_loc in usages:
+            if (area, room_idx) in self.pixels:
+                self.draw_cell(area, room_idx, mt_loc)
+                self.pixmaps.pop((area, room_idx), None)
+
+    def draw_cell(self, area, room_idx, mt_loc):
+        room = self.rooms_data[area][room_idx]
+        mt_idx = int(room['tilemap'][mt_loc])
+        mts = self.mt_images.metatile_data[area]
+        x = mt_loc%0x10*0x10
+        y = mt_loc//0x10*0x10
+        self.pixels[(area, room_idx)][y:y+0x10, x:x+0x10] = compose_tiles(self.mt_images.area_tiles(area), 2, mts[mt_idx*4:mt_idx*4+4], int(room['attrs'][mt_loc]))
+
+    def colors_changed(self, area):
+        color_table = self.mt_images.color_table(area)
+        for (image_area, room_idx), image in self.images.items():
+            if image_area == area:
+                image.setColorTable(color_table)
+        for key in [key for key in self.pixmaps if key[0] == area]:
+            del self.pixmaps[key]
@@ -0,0 +1,64 @@
+from PySide6.QtCore import QPointF, QRectF
+from PySide6.QtGui import QFont, QFontMetrics, QImage, QPainter, QPen, QPixmap
+import math
+
+# Labels 00 to FF, then 00, to FF, for the first half of map coordinates
+HEX_LABELS = [f'{i:02X}' for i in range(0x100)]+[f'{i:02X},' for i in range(0x100)]
+COMMA = 0x100
+
+atlases = {}
+
+class LabelAtlas:
+    '''HEX_LABELS pre-rendered in one font and color at one scale and DPI, so drawing a label is a pixmap blit instead of text layout'''
+    COLUMNS = 0x20
+    PAD = 2
+
+    def __init__(self, font, color, scale, dpi_x, dpi_y):
+        self.scale = scale
+        image = QImage(1, 1, QImage.Format_ARGB32_Premultiplied)
+        image.setDotsPerMeterX(round(dpi_x/0.0254))
+        image.setDotsPerMeterY(round(dpi_y/0.0254))
+        metrics = QFontMetrics(font, image)
+
+        # Cells are whole device pixels, labels sit in them PAD in from the left and the ascent down from the top like drawText's baseline
+        self.ascent = metrics.ascent()+LabelAtlas.PAD
+        self.cell_width = math.ceil((max(metrics.horizontalAdvance(label) for label in HEX_LABELS)+LabelAtlas.PAD*2)*scale)
+        self.cell_height = math.ceil((metrics.height()+LabelAtlas.PAD*2)*scale)
+
+        rows = math.ceil(len(HEX_LABELS)/LabelAtlas.COLUMNS)
+        image = QImage(self.cell_width*LabelAtlas.COLUMNS, self.cell_height*rows, QImage.Format_ARGB32_Premultiplied)
+        image.setDotsPerMeterX(round(dpi_x/0.0254))
+        image.setDotsPerMeterY(round(dpi_y/0.0254))
+        image.fill(0)
+        painter = QPainter(image)
+        painter.scale(scale, scale)
+        painter.setFont(font)
+        painter.setPen(QPen(color))
+        for i, label in enumerate(HEX_LABELS):
+            painter.drawText(QPointF(i%LabelAtlas.COLUMNS*self.cell_width/scale+LabelAtlas.PAD, i//LabelAtlas.COLUMNS*self.cell_height/scale+self.ascent), label)
+        painter.end()
+        self.pixmap = QPixmap.fromImage(image)
+        self.sources = [QRectF(i%LabelAtlas.COLUMNS*self.cell_width, i//LabelAtlas.COLUMNS*self.cell_height, self.cell_width, self.cell_height) for i in range(len(HEX_LABELS))]
+
+    def draw(self, painter: QPainter, labels):
+        '''Draws (x, y, label index) like painter.drawText(x, y, HEX_LABELS[label index])'''
+        # Blitted 1:1 in device pixels, the atlas is already at the painter's scale
+        transform = painter.worldTransform()
+        scale_x = transform.m11()
+        scale_y = transform.m22()
+        dx = transform.dx()-LabelAtlas.PAD*scale_x
+        dy = transform.dy()-self.ascent*scale_y
+        painter.save()
+        painter.resetTransform()
+        for x, y, i in labels:
+            painter.drawPixmap(QPointF(x*scale_x+dx, y*scale_y+dy), self.pixmap, self.sources[i])
+        painter.restore()
+
+def draw_labels(painter: QPainter, font: QFont, color, labels):
+    '''Draws (x, y, label index) labels of HEX_LABELS with the atlas for the font, color and the painter's scale and DPI'''
+    scale = painter.worldTransform().m11()
+    device = painter.device()
+    key = (font.key(), color, scale, device.logicalDpiX(), device.logicalDpiY())
+    if key not in atlases:
+        atlases[key] = LabelAtlas(font, color, *key[2:])
+    atlases[key].draw(painter, labels)
@@ -0,0 +1,186 @@
+''' LZSA1 raw block compression (https://github.com/emmanuel-marty/lzsa), same output format as `lzsa -f 1 -r` '''
+import numpy as np
+
+VERSION = 1 # bump whenever the output of compress changes, so cached blocks aren't reused
+MIN_MATCH = 3
+LITERALS_RUN_LEN = 7
+MATCH_RUN_LEN = 15
+MAX_OFFSET = 0xFFFF
+MAX_BLOCK_SIZE = 0xFFFF
+LAST_LITERALS = 1 # blocks always end with a literal, like lzsa's own parser
+
+def match_len_size(n):
+    '''Extra bytes needed to encode a match length'''
+    if n < MIN_MATCH+MATCH_RUN_LEN:
+        return 0
+    elif n < 0x100:
+        return 1
+    elif n < 0x200:
+        return 2
+    else:
+        return 3
+
+LENGTHS = np.arange(MAX_BLOCK_SIZE+1)
+MATCH_LEN_SIZES = np.array([match_len_size(length) for length in LENGTHS], dtype=np.int64)
+
+def longest_matches(data):
+    '''For every position, the longest match with a 1-byte offset and the longest match with any offset'''
+    n = len(data)
+    longest_8 = np.zeros(n+1, dtype=np.intp)
+    longest_16 = np.zeros(n+1, dtype=np.intp)
+    positions = np.arange(n)
+    for first_offset in range(1, min(n, MAX_OFFSET+1), 0x100):
+        offsets = np.arange(first_offset, min(first_offset+0x100, n, MAX_OFFSET+1))[:, np.newaxis]
+        sources = positions-offsets
+        same = (sources >= 0) & (data == data[np.maximum(sources, 0)])
+
+        # Length of the run of equal bytes starting at each position, for 256 offsets at a time
+        next_diff = np.where(same, n, positions)
+        runs = np.minimum.accumulate(next_diff[:, ::-1], axis=1)[:, ::-1]-positions
+        np.maximum(longest_16[:n], runs.max(axis=0), out=longest_16[:n])
+        if first_offset == 1:
+            longest_8[:n] = runs.max(axis=0) # offsets 1-256
+    return longest_8, longest_16
+
+def match_offset(data, pos, length):
+    '''Closest offset with a match of at least length bytes at pos'''
+    for offset in range(1, min(pos, MAX_OFFSET)+1):
+        if data[pos-offset:pos-offset+length].tobytes() == data[pos:pos+length].tobytes():
+            return offset
+
+def compress(raw):
+    '''Compresses up to 64KB-1 into an LZSA1 raw block, ending with the EOD marker.
+    Parsing is optimal for size; this is meant for small blocks like rooms'''
+    data = np.frombuffer(bytes(raw), dtype=np.uint8)
+    n = len(data)
+    if n > MAX_BLOCK_SIZE:
+        raise ValueError(f'LZSA1 raw blocks are limited to {MAX_BLOCK_SIZE} bytes, got {n}')
+    match_end = max(n-LAST_LITERALS, 0)
+    longest_8, longest_16 = longest_matches(data)
+
+    # Walk backwards computing the cheapest encoding of data[pos:]:
+    # best[pos] starts with a literal run, after_literals[pos] starts with a match (or the EOD marker at n)
+    inf = 1 << 30
+    best = np.full(n+1, inf, dtype=np.int64)
+    after_literals = np.full(n+1, inf, dtype=np.int64)
+    match_len = np.zeros(n+1, dtype=np.intp)
+    literals_end = np.zeros(n+1, dtype=np.intp)
+    after_literals[n] = 4 # offset byte, 238, 16-bit zero match length
+
+    # The literals length costs 0, 1, 2 or 3 extra bytes depending on these ranges, so each range is a plain minimum
+    run_ranges = ((0, LITERALS_RUN_LEN, 0), (LITERALS_RUN_LEN, 0x100, 1), (0x100, 0x200, 2), (0x200, MAX_BLOCK_SIZE+1, 3))
+    pos_plus_after = np.full(n+1, inf, dtype=np.int64)
+    pos_plus_after[n] = n+after_literals[n]
+
+    for pos in range(n, -1, -1):
+        if pos < match_end:
+            max_len = min(longest_16[pos], match_end-pos)
+            if max_len >= MIN_MATCH:
+                candidates = LENGTHS[MIN_MATCH:max_len+1]
+                costs = np.where(candidates <= longest_8[pos], 1, 2) + MATCH_LEN_SIZES[MIN_MATCH:max_len+1] + best[pos+MIN_MATCH:pos+max_len+1]
+                i = len(costs)-1-costs[::-1].argmin() # longest of the cheapest
+                after_literals[pos] = costs[i]
+                match_len[pos] = candidates[i]
+                pos_plus_after[pos] = pos+costs[i]
+
+        best_cost = inf
+        for start, end, extra in run_ranges:
+            window = pos_plus_after[pos+start:pos+end]
+            if len(window) > 0:
+                i = window.argmin()
+                if window[i]+extra < best_cost:
+                    best_cost = window[i]+extra
+                    literals_end[pos] = pos+start+i
+        best[pos] = 1+best_cost-pos
+
+    out = bytearray()
+    pos = 0
+    while True:
+        end = literals_end[pos]
+        num_literals = end-pos
+        if end == n:
+            length, offset = MIN_MATCH+MATCH_RUN_LEN, 0x100 # EOD
+        else:
+            length = match_len[end]
+            offset = match_offset(data, end, length)
+
+        token = (min(num_literals, LITERALS_RUN_LEN) << 4) | min(length-MIN_MATCH, MATCH_RUN_LEN)
+        if offset > 0x100:
+            token |= 0x80
+        out.append(token)
+
+        if num_literals >= LITERALS_RUN_LEN:
+            if num_literals < 0x100:
+                out.append(num_literals-LITERALS_RUN_LEN)
+            elif num_literals < 0x200:
+                out.extend((250, num_literals-0x100))
+            else:
+                out.extend((249, num_literals & 0xFF, num_literals >> 8))
+        out.extend(data[pos:end].tobytes())
+
+        out.append(-offset & 0xFF)
+        if offset > 0x100:
+            out.append((-offset >> 8) & 0xFF)
+
+        if end == n:
+            out.extend((238, 0, 0))
+            return bytes(out)
+
+        if length >= MIN_MATCH+MATCH_RUN_LEN:
+            if length < 0x100:
+                out.append(length-MIN_MATCH-MATCH_RUN_LEN)
+            elif length < 0x200:
+                out.extend((239, length-0x100))
+            else:
+                out.extend((238, length & 0xFF, length >> 8))
+        pos = end+length
+
+def decompress(block):
+    '''Decompresses an LZSA1 raw block ending with the EOD marker'''
+    out = bytearray()
+    pos = 0
+    while True:
+        token = block[pos]
+        pos += 1
+
+        num_literals = (token >> 4) & 7
+        if num_literals == LITERALS_RUN_LEN:
+            extra = block[pos]
+            pos += 1
+            if extra == 249:
+                num_literals = block[pos] | (block[pos+1] << 8)
+                pos += 2
+            elif extra == 250:
+                num_literals = 0x100+block[pos]
+                pos += 1
+            else:
+                num_literals += extra
+        out.extend(block[pos:pos+num_literals])
+        pos += num_literals
+
+        if token & 0x80:
+            offset = 0x10000-(block[pos] | (block[pos+1] << 8))
+            pos += 2
+        else:
+            offset = 0x100-block[pos]
+            pos += 1
+
+        length = (token & 0xF)+MIN_MATCH
+        if length == MIN_MATCH+MATCH_RUN_LEN:
+            extra = block[pos]
+            pos += 1
+            if extra == 238:
+                length = block[pos] | (block[pos+1] << 8)
+                pos += 2
+                if length == 0: # EOD
+                    return bytes(out)
+            elif extra == 239:
+                length = 0x100+block[pos]
+                pos += 1
+            else:
+                length += extra
+
+        if offset > len(out):
+            raise ValueError(f'Match offset {offset} goes before the start of the data at {len(out)}')
+        for _ in range(length):
+            out.append(out[-offset])
@@ -1,13 +1,61 @@
-from PySide6.QtCore import Qt, Signal, Slot
+from PySide6.QtCore import Qt, Signal, Slot, QTimer
 from PySide6.QtWidgets import *
 from src.pal_utils import convert_palette, put_palette_strings
-from src.twobpp import gfx_2_qimage
+from src.image_cache import MetatileImageCache, RoomImageCache
 from src.metatile_edit_window import MetatileEditWindow
 from src.room_edit_window import RoomEditWindow
 from src.map_edit_window import MapEditWindow
 from src.palette_edit_window import PaletteEditWindow
 from src.to_asm import palettes_2_asm, room_2_bytes, room_ptrs_and_incbins, global_objs_2_asm
-import copy, base64, json, os.path, subprocess, tempfile
+from src.room_compress import compress_rooms
+from src.room_cache import CompressedRoomCache
+from src.dirty_state import DirtyState, stream_if_changed, write_if_changed
+from src.snapshot import load_snapshot, save_snapshot
+from src.obj_record import ObjRecord
+from src.obj_codec import ObjCodec
+from src.metatile_usage import MetatileUsageIndex
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import base64, json, os.path
+
+def read_area(folder_path, area):
+    '''Reads an area's files and converts them into something that can be used by the editor.
+    Rooms and global objects come from the area's binary snapshot if the JSON files haven't changed since it was made.
+    Returns a dict of the area's data, with 'snapshot_up_to_date' telling whether the snapshot was used'''
+    with open(os.path.join(folder_path, f'{area}/bg.chr'), 'rb') as f:
+        gfx = bytearray(f.read())
+
+    with open(os.path.join(folder_path, f'{area}/palettes.json'), 'r') as f:
+        pals = json.load(f)
+
+    with open(os.path.join(folder_path, f'{area}/metatiles.bin'), 'rb') as f:
+        metatile_data = list(f.read(0xFF*4).ljust(0xFF*4, b'\0'))+[0xFF]*4
+
+    snapshot = load_snapshot(os.path.join(folder_path, f'.cache/snapshots/{area}.npz'), folder_path, area)
+    if snapshot is not None:
+        rooms, global_objs = snapshot
+    else:
+        with open(os.path.join(folder_path, f'{area}/rooms.json'), 'r') as f:
+            rooms = json.load(f)
+
+        with open(os.path.join(folder_path, f'{area}/global_objs.json'), 'r') as f:
+            raw_global_objs = json.load(f)
+
+        for room in rooms:
+            room['tilemap'] = np.frombuffer(bytearray(base64.b64decode(room['tilemap'])), dtype=np.uint8)
+            room['attrs'] = np.frombuffer(bytearray(base64.b64decode(room['attrs'])), dtype=np.uint8)
+            room['objs'] = [ObjRecord.from_dict(obj) for obj in room['objs']]
+
+        global_objs = [ObjRecord.from_dict(obj) for obj in raw_global_objs]
+
+    return {
+        'gfx': gfx,
+        'pals': pals,
+        'metatile_data': metatile_data,
+        'rooms': rooms,
+        'global_objs': global_objs,
+        'snapshot_up_to_date': snapshot is not None
+    }
 
 class MainWindow(QMainWindow):
     def __init__(self, folder_path, parent=None):
@@ -41,13 +89,17 @@ class MainWindow(QMainWindow):
 
         self.setCentralWidget(self.area_select)
 
+        self.mt_images = MetatileImageCache(self.gfx, self.pals, self.metatile_data)
+        self.room_images = RoomImageCache(self.mt_images, self.rooms_data)
+        self.mt_usage = MetatileUsageIndex(self.rooms_data)
+
         self.metatile_edit_window = MetatileEditWindow(self.gfx[a], self.pals[a], self.metatile_data[a], self)
         #self.metatile_edit_window.show()
 
-        self.room_edit_window = RoomEditWindow(self.gfx[a], self.pals[a], self.metatile_data[a], self.rooms_data[a], self.local_obj_types, self)
+        self.room_edit_window = RoomEditWindow(a, self.mt_images, self.metatile_data[a], self.rooms_data[a], self.local_obj_types, self)
         self.room_edit_window.show()
 
-        self.map_edit_window = MapEditWindow(self.gfx[a], self.pals[a], self.metatile_data[a], self.rooms_data[a], self.global_obj_data[a], self.global_obj_types, self.world_map, self)
+        self.map_edit_window = MapEditWindow(a, self.room_images, self.rooms_data[a], self.global_obj_data[a], self.global_obj_types, self.world_map, self)
         self.map_edit_window.show()
 
         self.palette_edit_window = PaletteEditWindow(self.pals[a], self)
@@ -56,29 +108,70 @@ class MainWindow(QMainWindow):
         self.area_select.currentTextChanged.connect(self.area_changed)
 
         self.metatile_edit_window.mt_edit.edited.connect(self.metatile_edited)
-        self.room_edit_window.room_edit.edited.connect(self.map_edit_window.room_edited)
+        self.room_edit_window.room_edit.edited.connect(self.room_edited)
         self.room_edit_window.new_room_added.connect(self.map_edit_window.new_room_added)
+        self.room_edit_window.new_room_added.connect(self.new_room_added)
+        self.room_edit_window.room_edit.objs_edited.connect(self.room_objs_edited)
+        self.map_edit_window.map_edit.edited.connect(self.world_map_edited)
+        self.map_edit_window.map_edit.objs_edited.connect(self.global_objs_edited)
 
         self.palette_edit_window.palette_scene.changed.connect(self.palette_changed)
 
+        # The other areas are read in the background once the windows are up
+        QTimer.singleShot(0, self.prefetch_areas)
+
     @Slot(str)
     def area_changed(self, area):
+        self.load_area(area)
         self.current_area = area
         self.metatile_edit_window.area_changed(self.gfx[area], self.pals[area], self.metatile_data[area])
-        self.room_edit_window.area_changed(self.gfx[area], self.pals[area], self.metatile_data[area], self.rooms_data[area])
-        self.map_edit_window.area_changed(self.gfx[area], self.pals[area], self.metatile_data[area], self.rooms_data[area], self.global_obj_data[area])
+        self.room_edit_window.area_changed(area, self.metatile_data[area], self.rooms_data[area])
+        self.map_edit_window.area_changed(area, self.rooms_data[area], self.global_obj_data[area])
         self.palette_edit_window.area_changed(self.pals[area])
 
     @Slot(int, int)
     def metatile_edited(self, mt_idx, corner):
-        self.room_edit_window.metatile_edited(mt_idx, corner)
-        self.map_edit_window.metatile_edited(mt_idx)
+        self.dirty.mark(self.current_area, 'metatiles')
+        usages = self.mt_usage.find(self.current_area, mt_idx)
+        self.mt_images.metatile_edited(self.current_area, mt_idx)
+        self.room_images.metatile_edited(self.current_area, usages)
+        self.room_edit_window.metatile_edited(mt_idx, corner, usages)
+        self.map_edit_window.metatile_edited(usages)
+
+    @Slot(int, int, int)
+    def room_edited(self, room_idx, x, y):
+        self.dirty.mark_room(self.current_area, room_idx)
+        self.mt_usage.cell_edited(self.current_area, room_idx, x, y)
+        self.room_images.cell_edited(self.current_area, room_idx, x, y)
+        self.map_edit_window.room_edited(room_idx, x, y)
+
+    @Slot(int)
+    def room_objs_edited(self, room_idx):
+        self.dirty.mark_room(self.current_area, room_idx)
+
+    @Slot()
+    def new_room_added(self):
+        self.dirty.mark_room(self.current_area, len(self.rooms_data[self.current_area])-1)
+
+    @Slot()
+    def world_map_edited(self):
+        self.dirty.mark_world_map()
+
+    @Slot()
+    def global_objs_edited(self):
+        self.dirty.mark(self.current_area, 'global_objs')
 
     @Slot(int)
     def palette_changed(self, pal):
-        self.metatile_edit_window.colors_changed(self.pals[self.current_area])
-        self.room_edit_window.colors_changed(self.pals[self.current_area])
-        self.map_edit_window.colors_changed(self.pals[self.current_area])
+        self.dirty.mark(self.current_area, 'palettes')
+
+        # Only the colors changed, so images are recolored instead of regenerated
+        if self.mt_images.colors_changed(self.current_area):
+            self.room_images.colors_changed(self.current_area)
+            color_table = self.mt_images.color_table(self.current_area)
+            self.metatile_edit_window.colors_changed(color_table)
+            self.room_edit_window.colors_changed()
+            self.map_edit_window.colors_changed()
 
     def open_folder(self, folder_path):
         self.folder_path = folder_path
@@ -88,54 +181,61 @@ class MainWindow(QMainWindow):
 
         with open(os.path.join(folder_path, 'local_obj_types.json'), 'r') as f:
             self.local_obj_types = json.load(f)
+        self.local_obj_codec = ObjCodec(self.local_obj_types)
 
         with open(os.path.join(folder_path, 'global_obj_types.json'), 'r') as f:
             self.global_obj_types = json.load(f)
+        self.global_obj_codec = ObjCodec(self.global_obj_types)
 
         with open(os.path.join(folder_path, 'world_map.bin'), 'rb') as f:
-            self.world_map = [int(b) for b in f.read()]
+            self.world_map = list(f.read())
+
+        self.room_cache = CompressedRoomCache(os.path.join(folder_path, '.cache/rooms'))
 
+        # Only what is edited gets saved, except for exported files that don't exist yet, like in a freshly extracted folder
+        self.dirty = DirtyState()
+
+        # Areas are loaded when they're first selected, only the first one is needed to show the editor
         self.gfx = {}
         self.pals = {}
         self.metatile_data = {}
         self.rooms_data = {}
         self.global_obj_data = {}
+        self.stale_snapshots = set()
+        self.area_reads = {}
+        self.area_reader = ThreadPoolExecutor(2)
+        self.load_area(self.area_names[0])
+
+    def prefetch_areas(self):
+        '''Starts reading the areas that aren't loaded yet on the worker threads'''
         for area in self.area_names:
-            with open(os.path.join(folder_path, f'{area}/bg.chr'), 'rb') as f:
-                self.gfx[area] = bytearray(f.read())
-
-            with open(os.path.join(folder_path, f'{area}/palettes.json'), 'r') as f:
-                self.pals[area] = json.load(f)
-
-            with open(os.path.join(folder_path, f'{area}/metatiles.bin'), 'rb') as f:
-                self.metatile_data[area] = [int.from_bytes(f.read(1), 'little') for _ in range(0xFF*4)]+[0xFF]*4
-
-            with open(os.path.join(folder_path, f'{area}/rooms.json'), 'r') as f:
-                raw_rooms = json.load(f)
-
-            with open(os.path.join(folder_path, f'{area}/global_objs.json'), 'r') as f:
-                raw_global_objs = json.load(f)
-
-            # Convert data into something that can be used by the editor
-            self.rooms_data[area] = copy.deepcopy(raw_rooms)
-            for room in self.rooms_data[area]:
-                room['tilemap'] = [int(b) for b in base64.b64decode(room['tilemap'])]
-                room['attrs'] = [int(b) for b in base64.b64decode(room['attrs'])]
-                obj_lists = []
-                for obj in room['objs']:
-                    obj_list = []
-                    for prop_name, prop in obj.items():
-                        obj_list.append([prop_name, prop])
-                    obj_lists.append(obj_list)
-                room['objs'] = obj_lists
-
-            obj_lists = []
-            for obj in raw_global_objs:
-                obj_list = []
-                for prop_name, prop in obj.items():
-                    obj_list.append([prop_name, prop])
-                obj_lists.append(obj_list)
-            self.global_obj_data[area] = obj_lists
+            if area not in self.rooms_data and area not in self.area_reads:
+                self.area_reads[area] = self.area_reader.submit(read_area, self.folder_path, area)
+
+    def load_area(self, area):
+        '''Makes an area's data available, waiting for its prefetch if there is one'''
+        if area in self.rooms_data:
+            return
+        read = self.area_reads.pop(area, None)
+        data = read.result() if read is not None else read_area(self.folder_path, area)
+
+        self.gfx[area] = data['gfx']
+        self.pals[area] = data['pals']
+        self.metatile_data[area] = data['metatile_data']
+        self.rooms_data[area] = data['rooms']
+        self.global_obj_data[area] = data['global_objs']
+        if not data['snapshot_up_to_date']:
+            self.stale_snapshots.add(area)
+
+        if not os.path.exists(os.path.join(self.folder_path, f'{area}/palettes.asm')):
+            self.dirty.mark(area, 'palettes')
+        if not os.path.exists(os.path.join(self.folder_path, f'{area}/global_objs.asm')):
+            self.dirty.mark(area, 'global_objs')
+        if not os.path.exists(os.path.join(self.folder_path, f'{area}/rooms.asm')):
+            self.dirty.mark(area, 'rooms')
+        for i in range(len(self.rooms_data[area])):
+            if not os.path.exists(os.path.join(self.folder_path, f'{area}/rooms/{i:02X}.bin')):
+                self.dirty.mark_room(area, i)
 
     @Slot(bool)
     def save_triggered(self, checked):
@@ -148,60 +248,68 @@ class MainWindow(QMainWindow):
         #with open(os.path.join(self.folder_path, 'global_obj_types.json'), 'w') as f:
         #    json.dump(self.global_obj_types, f, indent=4)
 
-        with open(os.path.join(self.folder_path, 'world_map.bin'), 'wb') as f:
-            f.write(bytearray(self.world_map))
+        if self.dirty.world_map:
+            write_if_changed(os.path.join(self.folder_path, 'world_map.bin'), bytes(self.world_map))
 
+        room_jobs = []
         for area in self.area_names:
+            # Areas that were never loaded weren't edited, but a freshly extracted one still has to be exported
+            if area not in self.rooms_data:
+                if all(os.path.exists(os.path.join(self.folder_path, f'{area}/{name}')) for name in ('palettes.asm', 'rooms.asm', 'global_objs.asm')):
+                    continue
+                self.load_area(area)
+
             #with open(os.path.join(self.folder_path, f'{area}/bg.chr'), 'wb') as f:
             #    f.write(bytearray(self.gfx[area]))
 
-            with open(os.path.join(self.folder_path, f'{area}/palettes.json'), 'w') as f:
-                json.dump(self.pals[area], f, indent=1)
-
-            with open(os.path.join(self.folder_path, f'{area}/metatiles.bin'), 'wb') as f:
-                f.write(bytearray(self.metatile_data[area][:0xFF*4]))
-
-            # Convert back to base64 and dict
-            rooms = copy.deepcopy(self.rooms_data[area])
-            for room in rooms:
-                room['tilemap'] = str(base64.b64encode(bytearray(room['tilemap'])), 'utf8')
-                room['attrs'] = str(base64.b64encode(bytearray(room['attrs'])), 'utf8')
-                obj_dicts = []
-                for obj in room['objs']:
-                    obj_dict = {}
-                    for prop_name, prop in obj:
-                        obj_dict[prop_name] = prop
-                    obj_dicts.append(obj_dict)
-                room['objs'] = obj_dicts
-
-            global_objs = []
-            for obj in self.global_obj_data[area]:
-                obj_dict = {}
-                for prop_name, prop in obj:
-                    obj_dict[prop_name] = prop
-                global_objs.append(obj_dict)
-
-            with open(os.path.join(self.folder_path, f'{area}/rooms.json'), 'w') as f:
-                json.dump(rooms, f, indent=1)
-
-            with open(os.path.join(self.folder_path, f'{area}/global_objs.json'), 'w') as f:
-                json.dump(global_objs, f, indent=1)
-
-            # Export ASM and compressed rooms
-            with open(os.path.join(self.folder_path, f'{area}/palettes.asm'), 'w') as f:
-                f.write(palettes_2_asm(self.pals[area]))
-
-            for i, room in enumerate(rooms):
-                f = tempfile.NamedTemporaryFile(delete_on_close=False)
-                f.write(room_2_bytes(room, self.local_obj_types))
-                f.close()
-                subprocess.run(f'./lzsa -f 1 -r {f.name} {os.path.join(self.folder_path, f'{area}/rooms/{i:02X}.bin')}', shell=True)
-
-            with open(os.path.join(self.folder_path, f'{area}/rooms.asm'), 'w') as f:
-                f.write(room_ptrs_and_incbins(area, len(rooms)))
-
-            with open(os.path.join(self.folder_path, f'{area}/global_objs.asm'), 'w') as f:
-                f.write(global_objs_2_asm(global_objs, self.global_obj_types))
+            if self.dirty.is_dirty(area, 'palettes'):
+                write_if_changed(os.path.join(self.folder_path, f'{area}/palettes.json'), json.dumps(self.pals[area], indent=1))
+                stream_if_changed(os.path.join(self.folder_path, f'{area}/palettes.asm'), palettes_2_asm(self.pals[area]))
+
+            if self.dirty.is_dirty(area, 'metatiles'):
+                write_if_changed(os.path.join(self.folder_path, f'{area}/metatiles.bin'), bytes(self.metatile_data[area][:0xFF*4]))
+
+            json_written = False
+            if self.dirty.is_dirty(area, 'rooms'):
+                # Convert back to base64 and dict
+                rooms = []
+                for room in self.rooms_data[area]:
+                    room = dict(room)
+                    room['tilemap'] = str(base64.b64encode(room['tilemap']), 'utf8')
+                    room['attrs'] = str(base64.b64encode(room['attrs']), 'utf8')
+                    room['objs'] = [obj.to_dict() for obj in room['objs']]
+                    rooms.append(room)
+
+                json_written |= write_if_changed(os.path.join(self.folder_path, f'{area}/rooms.json'), json.dumps(rooms, indent=1))
+                stream_if_changed(os.path.join(self.folder_path, f'{area}/rooms.asm'), room_ptrs_and_incbins(area, len(rooms)))
+
+                # Export compressed rooms
+                for i in self.dirty.dirty_rooms(area):
+                    room_jobs.append(((area, i), room_2_bytes(rooms[i], self.local_obj_codec)))
+
+            if self.dirty.is_dirty(area, 'global_objs'):
+                global_objs = [obj.to_dict() for obj in self.global_obj_data[area]]
+
+                json_written |= write_if_changed(os.path.join(self.folder_path, f'{area}/global_objs.json'), json.dumps(global_objs, indent=1))
+                stream_if_changed(os.path.join(self.folder_path, f'{area}/global_objs.asm'), global_objs_2_asm(global_objs, self.global_obj_codec))
+
+            if json_written or area in self.stale_snapshots:
+                if save_snapshot(os.path.join(self.folder_path, f'.cache/snapshots/{area}.npz'), self.folder_path, area, self.rooms_data[area], self.global_obj_data[area]):
+                    self.stale_snapshots.discard(area)
+
+        # Compress the rooms of every area at once
+        compressed, failures = compress_rooms(room_jobs, cache=self.room_cache)
+        for (area, i), block in compressed.items():
+            write_if_changed(os.path.join(self.folder_path, f'{area}/rooms/{i:02X}.bin'), block)
+
+        # Rooms that failed stay dirty so the next save tries them again
+        self.dirty.clear()
+        for (area, i), error in failures:
+            self.dirty.mark_room(area, i)
+
+        if failures:
+            failures.sort()
+            QMessageBox.warning(self, 'Save', 'These rooms could not be compressed and were not saved:\n' + '\n'.join(f'{area} room {i:02X}: {error}' for (area, i), error in failures))
 
     @Slot(bool)
     def show_mt_edit_triggered(self, checked):
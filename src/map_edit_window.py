@@ -1,36 +1,33 @@
 from PySide6.QtCore import Qt, Signal, Slot, QAbstractListModel, QAbstractTableModel, QModelIndex, QMimeData, QRectF
-from PySide6.QtGui import QImage, QPainter, QBrush, QPen, QFont
+from PySide6.QtGui import QImage, QPainter, QBrush, QPen, QFont, QFontMetricsF
 from PySide6.QtWidgets import *
-from src.pal_utils import convert_palette, put_palette_strings
-from src.twobpp import gfx_2_qimage
-from src.obj_widgets import ObjectGraphicsItem, ObjPropsModel, ObjPropsDelegate, ObjList
+from src.obj_widgets import ObjItemPool, ObjPropsModel, ObjPropsDelegate, ObjList
+from src.label_atlas import draw_labels, COMMA
 import math
 
 class MapEditWindow(QMainWindow):
     class RoomSelect(QGraphicsScene):
         changed = Signal(int)
 
-        def __init__(self, gfx, pals, metatile_data, rooms_data, parent=None):
+        def __init__(self, area, room_images, rooms_data, parent=None):
             super().__init__(parent)
 
+            self.room_images = room_images
+
             self.selected_room_rect = QGraphicsRectItem(0, 0, 0x100, 0xF0)
             pen = QPen(0x00FF00)
             pen.setJoinStyle(Qt.MiterJoin)
             self.selected_room_rect.setPen(pen)
             self.addItem(self.selected_room_rect)
 
-            self.area_changed(gfx, pals, metatile_data, rooms_data)
+            self.area_changed(area, rooms_data)
 
             self.show_grid = False
             self.show_room_idxs = False
 
         def drawBackground(self, painter: QPainter, rect: QRectF):
             for room_i in range(int(rect.top()//0xF0), min(math.ceil(rect.bottom()/0xF0-0.01), len(self.rooms_data))): # account for roundoff error
-                tm = self.rooms_data[room_i]['tilemap']
-                attrs = self.rooms_data[room_i]['attrs']
-                for row in range(0xF):
-                    for col in range(0x10):
-                        painter.drawImage(col*0x10, row*0x10+room_i*0xF0, self.mt_images[attrs[col+row*0x10]][tm[col+row*0x10]])
+                painter.drawPixmap(0, room_i*0xF0, self.room_images.pixmap(self.area, room_i))
 
             pen = QPen(0xFFFFFF)
             pen.setJoinStyle(Qt.MiterJoin)
@@ -40,10 +37,9 @@ class MapEditWindow(QMainWindow):
                     painter.drawRect(0, room_i*0xF0, 0x100, 0xF0)
 
             if self.show_room_idxs:
-                painter.setFont(QFont('monospace', 30, QFont.Bold))
-                for room_i in range(int(rect.top()//0xF0), min(math.ceil(rect.bottom()/0xF0-0.01), len(self.rooms_data))):
-                    painter.drawText(0, room_i*0xF0+0x24, f'{room_i:02X}')
-                painter.drawText(0, len(self.rooms_data)*0xF0+0x24, 'FF')
+                labels = [(0, room_i*0xF0+0x24, room_i) for room_i in range(int(rect.top()//0xF0), min(math.ceil(rect.bottom()/0xF0-0.01), len(self.rooms_data)))]
+                labels.append((0, len(self.rooms_data)*0xF0+0x24, 0xFF))
+                draw_labels(painter, QFont('monospace', 30, QFont.Bold), 0xFFFFFF, labels)
 
         def mousePressEvent(self, event):
             super().mousePressEvent(event)
@@ -66,37 +62,24 @@ class MapEditWindow(QMainWindow):
             self.show_room_idxs = state == Qt.Checked
             self.update(self.sceneRect())
 
-        def area_changed(self, gfx, pals, metatile_data, rooms_data):
+        def area_changed(self, area, rooms_data):
             self.setSceneRect(0, 0, 0x100, 0xF0*len(rooms_data)+0xF1)
 
-            self.gfx = gfx
-            self.pals = pals
-            self.metatile_data = metatile_data
+            self.area = area
             self.rooms_data = rooms_data
 
-            # Generate metatile images
-            self.mt_images = []
-            pal = convert_palette(put_palette_strings(pals[0]), 'src/palette.pal', transparent=False)
-            for pal_idx in range(4):
-                mts_per_pal = []
-                for i in range(0x100):
-                    mts_per_pal.append(gfx_2_qimage(gfx, pal, width=2, idxs=metatile_data[i*4:i*4+4], pal_per_tile=[pal_idx]*4))
-                self.mt_images.append(mts_per_pal)
-
             self.selected_room = 0
             self.selected_room_rect.setPos(0, 0)
 
             self.update(self.sceneRect())
 
-        def colors_changed(self, pals):
-            self.area_changed(self.gfx, pals, self.metatile_data, self.rooms_data)
-
-        def metatile_edited(self, mt_idx):
-            pal = convert_palette(put_palette_strings(self.pals[0]), 'src/palette.pal', transparent=False)
-            for pal_idx in range(4):
-                self.mt_images[pal_idx][mt_idx] = gfx_2_qimage(self.gfx, pal, width=2, idxs=self.metatile_data[mt_idx*4:mt_idx*4+4], pal_per_tile=[pal_idx]*4)
+        def colors_changed(self):
             self.update(self.sceneRect())
 
+        def metatile_edited(self, usages):
+            for room_idx, mt_loc in usages:
+                self.update(mt_loc%0x10*0x10, room_idx*0xF0+mt_loc//0x10*0x10, 0x10, 0x10)
+
         def room_edited(self, room_idx, x, y):
             self.update(x, y+room_idx*0xF0, 0x10, 0x10)
 
@@ -113,27 +96,31 @@ class MapEditWindow(QMainWindow):
             self.setFrameStyle(QFrame.NoFrame)
 
     class MapEdit(QGraphicsScene):
-        def __init__(self, gfx, pals, metatile_data, rooms_data, global_obj_data, world_map, parent=None):
+        edited = Signal()
+        objs_edited = Signal()
+
+        def __init__(self, area, room_images, rooms_data, global_obj_data, world_map, parent=None):
             super().__init__(0, 0, 0x100*0x20+1, 0xF0*0x20+1, parent)
 
+            self.room_images = room_images
             self.world_map = world_map
 
             self.show_grid = False
             self.show_room_idxs = False
             self.show_map_coords = False
 
-            self.area_changed(gfx, pals, metatile_data, rooms_data, global_obj_data)
+            self.obj_items = ObjItemPool(self, local=False)
+            self.area_changed(area, rooms_data, global_obj_data)
 
         def drawBackground(self, painter: QPainter, rect: QRectF):
+            # Zoomed out, draw smaller copies of the rooms instead of scaling full size ones on the fly
+            mip_level = self.room_images.mip_level(painter.worldTransform().m11())
             for map_row in range(int(rect.top()//0xF0), math.ceil(rect.bottom()/0xF0-0.01)): # account for roundoff error
                 for map_col in range(int(rect.left()//0x100), math.ceil(rect.right()/0x100-0.01)):
                     room_i = self.world_map[map_col+map_row*0x20]
                     if room_i < len(self.rooms_data):
-                        tm = self.rooms_data[room_i]['tilemap']
-                        attrs = self.rooms_data[room_i]['attrs']
-                        for row in range(0xF):
-                            for col in range(0x10):
-                                painter.drawImage(col*0x10+map_col*0x100, row*0x10+map_row*0xF0, self.mt_images[attrs[col+row*0x10]][tm[col+row*0x10]])
+                        pixmap = self.room_images.pixmap(self.area, room_i, mip_level)
+                        painter.drawPixmap(QRectF(map_col*0x100, map_row*0xF0, 0x100, 0xF0), pixmap, QRectF(pixmap.rect()))
 
             pen = QPen(0xFFFFFF)
             pen.setJoinStyle(Qt.MiterJoin)
@@ -145,21 +132,27 @@ class MapEditWindow(QMainWindow):
                             painter.drawRect(col*0x100, row*0xF0, 0x100, 0xF0)
 
             if self.show_room_idxs:
-                painter.setFont(QFont('monospace', 30, QFont.Bold))
+                labels = []
                 for row in range(int(rect.top()//0xF0), math.ceil(rect.bottom()/0xF0-0.01)):
                     for col in range(int(rect.left()//0x100), math.ceil(rect.right()/0x100-0.01)):
                         room_i = self.world_map[col+row*0x20]
                         if room_i != 0xFF:
-                            painter.drawText(col*0x100, row*0xF0+0x24, f'{room_i:02X}')
+                            labels.append((col*0x100, row*0xF0+0x24, room_i))
+                draw_labels(painter, QFont('monospace', 30, QFont.Bold), 0xFFFFFF, labels)
 
             if self.show_map_coords:
-                painter.setFont(QFont('monospace', 15, QFont.Bold))
+                # "col," then "row" where drawText would put it
+                font = QFont('monospace', 15, QFont.Bold)
+                row_x = QFontMetricsF(font, painter.device()).horizontalAdvance('00,')
                 y_offset = 0x38 if self.show_room_idxs else 0x38-0x24
+                labels = []
                 for row in range(int(rect.top()//0xF0), math.ceil(rect.bottom()/0xF0-0.01)):
                     for col in range(int(rect.left()//0x100), math.ceil(rect.right()/0x100-0.01)):
                         room_i = self.world_map[col+row*0x20]
                         if room_i != 0xFF:
-                            painter.drawText(col*0x100, row*0xF0+y_offset, f'{col:02X},{row:02X}')
+                            labels.append((col*0x100, row*0xF0+y_offset, COMMA+col))
+                            labels.append((col*0x100+row_x, row*0xF0+y_offset, row))
+                draw_labels(painter, font, 0xFFFFFF, labels)
 
         def mousePressEvent(self, event):
             super().mousePressEvent(event)
@@ -167,8 +160,14 @@ class MapEditWindow(QMainWindow):
             if self.mouseGrabberItem() == None and event.button() == Qt.LeftButton:
                 x = event.scenePos().x()
                 y = event.scenePos().y()
-                self.world_map[int(x//0x100+y//0xF0*0x20)] = self.selected_room
-                self.update(x//0x100*0x100, y//0xF0*0xF0, 0x100, 0xF0)
+                map_i = int(x//0x100+y//0xF0*0x20)
+                if self.world_map[map_i] != self.selected_room:
+                    self.room_cells[self.world_map[map_i]].discard(map_i)
+                    self.world_map[map_i] = self.selected_room
+                    self.room_cells.setdefault(self.selected_room, set()).add(map_i)
+                    self.update(x//0x100*0x100, y//0xF0*0xF0, 0x100, 0xF0)
+
+                    self.edited.emit()
 
         @Slot(int)
         def room_select_changed(self, room_i):
@@ -176,20 +175,20 @@ class MapEditWindow(QMainWindow):
 
         @Slot(list)
         def obj_list_changed(self, objs):
-            # Update objs display
-            self.clear()
-            self.objs = []
-            for i, obj_data in enumerate(self.global_obj_data): # instead of enumerate(objs) due to a PySide6 bug
-                obj = ObjectGraphicsItem(obj_data, i, local=False)
-                self.addItem(obj)
-                self.objs.append(obj)
+            # Update objs display, only the items of added or removed objects change
+            self.objs = self.obj_items.sync(self.global_obj_data) # instead of objs due to a PySide6 bug
 
         @Slot(int)
         def obj_data_changed(self, idx):
             obj_data = self.objs[idx].obj_data
-            self.objs[idx].setPos(obj_data[1][1], obj_data[2][1]//0x100*0xF0+(obj_data[2][1]&0xFF))
+            self.objs[idx].setPos(obj_data.x, obj_data.y//0x100*0xF0+(obj_data.y&0xFF))
             self.objs[idx].update(self.objs[idx].boundingRect())
 
+            self.objs_edited.emit()
+
+        def obj_moved(self, idx):
+            self.objs_edited.emit()
+
         @Slot(Qt.CheckState)
         def show_grid_toggled(self, state):
             self.show_grid = state == Qt.Checked
@@ -207,24 +206,19 @@ class MapEditWindow(QMainWindow):
 
         @Slot(Qt.CheckState)
         def show_objs_toggled(self, state):
-            for obj in self.objs:
-                obj.setVisible(state == Qt.Checked)
+            self.obj_items.set_visible(state == Qt.Checked)
+
+        def index_rooms(self):
+            '''Map cells of each room index, kept up to date as rooms are placed on the map'''
+            self.room_cells = {}
+            for map_i, room_i in enumerate(self.world_map):
+                self.room_cells.setdefault(room_i, set()).add(map_i)
 
-        def area_changed(self, gfx, pals, metatile_data, rooms_data, global_obj_data):
-            self.gfx = gfx
-            self.pals = pals
-            self.metatile_data = metatile_data
+        def area_changed(self, area, rooms_data, global_obj_data):
+            self.area = area
             self.rooms_data = rooms_data
             self.global_obj_data = global_obj_data
-
-            # Generate metatile images
-            self.mt_images = []
-            pal = convert_palette(put_palette_strings(pals[0]), 'src/palette.pal', transparent=False)
-            for pal_idx in range(4):
-                mts_per_pal = []
-                for i in range(0x100):
-                    mts_per_pal.append(gfx_2_qimage(gfx, pal, width=2, idxs=metatile_data[i*4:i*4+4], pal_per_tile=[pal_idx]*4))
-                self.mt_images.append(mts_per_pal)
+            self.index_rooms()
 
             self.selected_room = 0
             self.update(self.sceneRect())
@@ -232,29 +226,60 @@ class MapEditWindow(QMainWindow):
             # Objects display
             self.obj_list_changed(self.global_obj_data)
 
-        def colors_changed(self, pals):
-            self.area_changed(self.gfx, pals, self.metatile_data, self.rooms_data, self.global_obj_data)
-
-        def metatile_edited(self, mt_idx):
-            pal = convert_palette(put_palette_strings(self.pals[0]), 'src/palette.pal', transparent=False)
-            for pal_idx in range(4):
-                self.mt_images[pal_idx][mt_idx] = gfx_2_qimage(self.gfx, pal, width=2, idxs=self.metatile_data[mt_idx*4:mt_idx*4+4], pal_per_tile=[pal_idx]*4)
+        def colors_changed(self):
             self.update(self.sceneRect())
 
-        def room_edited(self):
-            self.update(self.sceneRect())
+        def metatile_edited(self, usages):
+            # The cells using the metatile in a room can be anywhere in it, so each map cell showing the room gets one rect around them
+            room_rects = {}
+            for room_idx, mt_loc in usages:
+                rect = QRectF(mt_loc%0x10*0x10, mt_loc//0x10*0x10, 0x10, 0x10)
+                room_rects[room_idx] = room_rects[room_idx].united(rect) if room_idx in room_rects else rect
+            for room_idx, rect in room_rects.items():
+                for map_i in self.room_cells.get(room_idx, ()):
+                    self.update(rect.translated(map_i%0x20*0x100, map_i//0x20*0xF0))
+
+        def room_edited(self, room_idx, x, y):
+            # Only the edited metatile in each cell showing the room
+            for map_i in self.room_cells.get(room_idx, ()):
+                self.update(map_i%0x20*0x100+x, map_i//0x20*0xF0+y, 0x10, 0x10)
 
         def new_room_added(self):
             self.update(self.sceneRect())
 
     class MapEditView(QGraphicsView):
+        zoom_changed = Signal(int)
+
         def __init__(self, scene, parent=None):
             super().__init__(parent)
             self.setScene(scene)
             self.scale(1, 1)
             self.setFrameStyle(QFrame.NoFrame)
 
-    def __init__(self, gfx, pals, metatile_data, rooms_data, global_obj_data, obj_types, world_map, parent=None):
+            self.zoom_level = 0
+
+        def wheelEvent(self, event):
+            if event.modifiers() & Qt.ControlModifier:
+                if event.angleDelta().y() > 0:
+                    self.set_zoom_level(max(self.zoom_level-1, 0))
+                elif event.angleDelta().y() < 0:
+                    self.set_zoom_level(min(self.zoom_level+1, MapEditWindow.ZOOM_LEVELS-1))
+            else:
+                super().wheelEvent(event)
+
+        @Slot(int)
+        def set_zoom_level(self, level):
+            '''Zooms out by a factor of 2**level'''
+            if level != self.zoom_level:
+                self.zoom_level = level
+                self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse if self.underMouse() else QGraphicsView.AnchorViewCenter)
+                self.resetTransform()
+                self.scale(0.5**level, 0.5**level)
+                self.zoom_changed.emit(level)
+
+    ZOOM_LEVELS = 4
+
+    def __init__(self, area, room_images, rooms_data, global_obj_data, obj_types, world_map, parent=None):
         super().__init__(parent)
 
         self.rooms_data = rooms_data
@@ -262,20 +287,24 @@ class MapEditWindow(QMainWindow):
         self.obj_types = obj_types
 
         # Room column
-        self.room_select = self.RoomSelect(gfx, pals, metatile_data, self.rooms_data)
+        self.room_select = self.RoomSelect(area, room_images, self.rooms_data)
         self.room_select_view = self.RoomSelectView(self.room_select)
         self.room_select_layout = QVBoxLayout()
         self.room_select_layout.addWidget(self.room_select_view)
 
         # Map column
-        self.map_edit = self.MapEdit(gfx, pals, metatile_data, self.rooms_data, self.global_obj_data, world_map)
+        self.map_edit = self.MapEdit(area, room_images, self.rooms_data, self.global_obj_data, world_map)
         self.map_edit_view = self.MapEditView(self.map_edit)
+        self.zoom_select = QComboBox()
+        for level in range(self.ZOOM_LEVELS):
+            self.zoom_select.addItem(f'{100*0.5**level:g}%')
         self.show_grid_toggle = QCheckBox()
         self.show_room_idxs_toggle = QCheckBox()
         self.show_map_coords_toggle = QCheckBox()
         self.show_objs_toggle = QCheckBox()
         self.show_objs_toggle.setCheckState(Qt.Checked)
         self.map_edit_form = QFormLayout()
+        self.map_edit_form.addRow('Zoom (Ctrl+wheel)', self.zoom_select)
         self.map_edit_form.addRow('Show grid', self.show_grid_toggle)
         self.map_edit_form.addRow('Show room indices', self.show_room_idxs_toggle)
         self.map_edit_form.addRow('Show map coordinates', self.show_map_coords_toggle)
@@ -326,6 +355,8 @@ class MapEditWindow(QMainWindow):
         self.show_room_idxs_toggle.checkStateChanged.connect(self.map_edit.show_room_idxs_toggled)
         self.show_map_coords_toggle.checkStateChanged.connect(self.map_edit.show_map_coords_toggled)
         self.show_objs_toggle.checkStateChanged.connect(self.map_edit.show_objs_toggled)
+        self.zoom_select.currentIndexChanged.connect(self.map_edit_view.set_zoom_level)
+        self.map_edit_view.zoom_changed.connect(self.zoom_select.setCurrentIndex)
 
         self.obj_list.pressed.connect(self.obj_list_pressed)
 
@@ -339,6 +370,8 @@ class MapEditWindow(QMainWindow):
             self.obj_props_model = None
         self.obj_props_table.setModel(self.obj_props_model)
 
+        self.map_edit.objs_edited.emit()
+
     @Slot(QModelIndex)
     def obj_list_pressed(self, index):
         self.obj_props_model = ObjPropsModel(self.global_obj_data[index.row()], index.row(), self.obj_types)
@@ -346,12 +379,12 @@ class MapEditWindow(QMainWindow):
 
         self.obj_props_model.changed.connect(self.map_edit.obj_data_changed)
 
-    def area_changed(self, gfx, pals, metatile_data, rooms_data, global_obj_data):
+    def area_changed(self, area, rooms_data, global_obj_data):
         self.rooms_data = rooms_data
         self.global_obj_data = global_obj_data
 
-        self.room_select.area_changed(gfx, pals, metatile_data, rooms_data)
-        self.map_edit.area_changed(gfx, pals, metatile_data, rooms_data, global_obj_data)
+        self.room_select.area_changed(area, rooms_data)
+        self.map_edit.area_changed(area, rooms_data, global_obj_data)
 
         self.obj_list.objs = global_obj_data
         self.obj_list.model = ObjList.ObjListModel(global_obj_data)
@@ -366,17 +399,17 @@ class MapEditWindow(QMainWindow):
             self.obj_props_model = None
         self.obj_props_table.setModel(self.obj_props_model)
 
-    def colors_changed(self, pals):
-        self.room_select.colors_changed(pals)
-        self.map_edit.colors_changed(pals)
+    def colors_changed(self):
+        self.room_select.colors_changed()
+        self.map_edit.colors_changed()
 
-    def metatile_edited(self, mt_idx):
-        self.room_select.metatile_edited(mt_idx)
-        self.map_edit.metatile_edited(mt_idx)
+    def metatile_edited(self, usages):
+        self.room_select.metatile_edited(usages)
+        self.map_edit.metatile_edited(usages)
 
     def room_edited(self, room_idx, x, y):
         self.room_select.room_edited(room_idx, x, y)
-        self.map_edit.room_edited()
+        self.map_edit.room_edited(room_idx, x, y)
 
     def new_room_added(self):
         self.room_select.new_room_added()
@@ -1,8 +1,11 @@
-from PySide6.QtCore import Qt, Signal, Slot
-from PySide6.QtGui import QImage, QPainter, QBrush, QPen, QFont
+from PySide6.QtCore import Qt, Signal, Slot, QRectF
+from PySide6.QtGui import QImage, QPixmap, QPainter, QBrush, QPen, QFont
 from PySide6.QtWidgets import *
-from src.pal_utils import convert_palette, put_palette_strings
-from src.twobpp import gfx_2_qimage
+from src.pal_utils import strings_to_color_table
+from src.twobpp import convert_tiles_from_bitplanes, tiles_2_qimage
+from src.overlay_layer import OverlayLayer
+from src.label_atlas import draw_labels
+import numpy as np
 
 class MetatileEditWindow(QMainWindow):
     class TileSelect(QGraphicsScene):
@@ -20,7 +23,7 @@ class MetatileEditWindow(QMainWindow):
             self.addItem(self.selected_tile_rect)
 
         def drawBackground(self, painter: QPainter, rect):
-            painter.drawImage(0, 0, self.tiles_image)
+            painter.drawPixmap(0, 0, self.tiles_pixmap)
 
         def mousePressEvent(self, event):
             super().mousePressEvent(event)
@@ -37,13 +40,17 @@ class MetatileEditWindow(QMainWindow):
 
         def area_changed(self, gfx, pals, pal_idx=0):
             self.gfx = gfx
+            self.tiles = convert_tiles_from_bitplanes(gfx)
             self.pals = pals
             self.pal_idx = pal_idx
-            self.tiles_image = gfx_2_qimage(gfx, convert_palette(put_palette_strings(pals[0]), 'src/palette.pal', transparent=False), pal_per_tile=[pal_idx]*0x100)
+            self.tiles_image = tiles_2_qimage(self.tiles, strings_to_color_table(pals[0], 'src/palette.pal', transparent=False), pal_per_tile=[pal_idx]*0x100)
+            self.tiles_pixmap = QPixmap.fromImage(self.tiles_image)
             self.update(self.sceneRect())
 
-        def colors_changed(self, pals):
-            self.area_changed(self.gfx, pals, self.pal_idx)
+        def colors_changed(self, color_table):
+            self.tiles_image.setColorTable(color_table)
+            self.tiles_pixmap = QPixmap.fromImage(self.tiles_image)
+            self.update(self.sceneRect())
 
     class TileSelectView(QGraphicsView):
         def __init__(self, scene, parent=None):
@@ -59,6 +66,9 @@ class MetatileEditWindow(QMainWindow):
         def __init__(self, gfx, pals, metatile_data, parent=None):
             super().__init__(0, 0, 256, 256, parent)
 
+            # Index text and highlights are drawn once into layers, redrawn when what they show changes
+            self.idxs_layer = OverlayLayer(0x100, 0x100, self.draw_idxs)
+            self.highlight_layer = OverlayLayer(0x100, 0x100, self.draw_highlights)
             self.area_changed(gfx, pals, metatile_data)
 
             self.selected_tile = 0
@@ -70,57 +80,43 @@ class MetatileEditWindow(QMainWindow):
             for row in range(0x10):
                 for col in range(0x10):
                     mt_idx = col+row*0x10
-                    painter.drawImage(col*0x10, row*0x10, self.tile_images[self.metatile_data[mt_idx*4]])
-                    painter.drawImage(col*0x10+8, row*0x10, self.tile_images[self.metatile_data[mt_idx*4+1]])
-                    painter.drawImage(col*0x10, row*0x10+8, self.tile_images[self.metatile_data[mt_idx*4+2]])
-                    painter.drawImage(col*0x10+8, row*0x10+8, self.tile_images[self.metatile_data[mt_idx*4+3]])
+                    painter.drawPixmap(col*0x10, row*0x10, self.tile_pixmaps[self.metatile_data[mt_idx*4]])
+                    painter.drawPixmap(col*0x10+8, row*0x10, self.tile_pixmaps[self.metatile_data[mt_idx*4+1]])
+                    painter.drawPixmap(col*0x10, row*0x10+8, self.tile_pixmaps[self.metatile_data[mt_idx*4+2]])
+                    painter.drawPixmap(col*0x10+8, row*0x10+8, self.tile_pixmaps[self.metatile_data[mt_idx*4+3]])
 
+            if self.show_tile_idxs:
+                self.idxs_layer.paint(painter)
+            if self.highlight_same_tiles:
+                self.highlight_layer.paint(painter)
+
+        def draw_idxs(self, painter: QPainter):
+            labels = []
+            for row in range(0x10):
+                for col in range(0x10):
+                    mt_idx = col+row*0x10
+                    labels.append((col*0x10+1, row*0x10+6, self.metatile_data[mt_idx*4]))
+                    labels.append((col*0x10+8+1, row*0x10+6, self.metatile_data[mt_idx*4+1]))
+                    labels.append((col*0x10+1, row*0x10+6+8, self.metatile_data[mt_idx*4+2]))
+                    labels.append((col*0x10+8+1, row*0x10+6+8, self.metatile_data[mt_idx*4+3]))
+            draw_labels(painter, QFont('monospace', 4, QFont.Bold), 0x00FF00, labels)
+
+        def draw_highlights(self, painter: QPainter):
+            # Metatile corners using the selected tile, corner i of metatile n is metatile_data[n*4+i]
+            corners = np.flatnonzero(np.asarray(self.metatile_data) == self.selected_tile).tolist()
+            rects = [QRectF(corner//4%0x10*0x10+corner%2*8, corner//4//0x10*0x10+corner//2%2*8, 8, 8) for corner in corners]
+
+            # Fills at half opacity, then outlines over them (workaround for Qt bug)
             pen = QPen(0x00FF00)
             pen.setJoinStyle(Qt.MiterJoin)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QBrush(0x00FF00))
+            painter.setOpacity(0.5)
+            painter.drawRects(rects)
             painter.setPen(pen)
-            if self.show_tile_idxs:
-                painter.setFont(QFont('monospace', 4, QFont.Bold))
-                for row in range(0x10):
-                    for col in range(0x10):
-                        mt_idx = col+row*0x10
-                        painter.drawText(col*0x10+1, row*0x10+6, f'{self.metatile_data[mt_idx*4]:02X}')
-                        painter.drawText(col*0x10+8+1, row*0x10+6, f'{self.metatile_data[mt_idx*4+1]:02X}')
-                        painter.drawText(col*0x10+1, row*0x10+6+8, f'{self.metatile_data[mt_idx*4+2]:02X}')
-                        painter.drawText(col*0x10+8+1, row*0x10+6+8, f'{self.metatile_data[mt_idx*4+3]:02X}')
-            if self.highlight_same_tiles:
-                # workaround for Qt bug
-                brush = QBrush(0x00FF00)
-                painter.setBrush(brush)
-                pen.setStyle(Qt.NoPen)
-                painter.setPen(pen)
-                painter.setOpacity(0.5)
-                for row in range(0x10):
-                    for col in range(0x10):
-                        mt_idx = col+row*0x10
-                        if self.metatile_data[mt_idx*4] == self.selected_tile:
-                            painter.drawRect(col*0x10, row*0x10, 8, 8)
-                        if self.metatile_data[mt_idx*4+1] == self.selected_tile:
-                            painter.drawRect(col*0x10+8, row*0x10, 8, 8)
-                        if self.metatile_data[mt_idx*4+2] == self.selected_tile:
-                            painter.drawRect(col*0x10, row*0x10+8, 8, 8)
-                        if self.metatile_data[mt_idx*4+3] == self.selected_tile:
-                            painter.drawRect(col*0x10+8, row*0x10+8, 8, 8)
-                brush.setStyle(Qt.NoBrush)
-                painter.setBrush(brush)
-                pen.setStyle(Qt.SolidLine)
-                painter.setPen(pen)
-                painter.setOpacity(1.0)
-                for row in range(0x10):
-                    for col in range(0x10):
-                        mt_idx = col+row*0x10
-                        if self.metatile_data[mt_idx*4] == self.selected_tile:
-                            painter.drawRect(col*0x10, row*0x10, 8, 8)
-                        if self.metatile_data[mt_idx*4+1] == self.selected_tile:
-                            painter.drawRect(col*0x10+8, row*0x10, 8, 8)
-                        if self.metatile_data[mt_idx*4+2] == self.selected_tile:
-                            painter.drawRect(col*0x10, row*0x10+8, 8, 8)
-                        if self.metatile_data[mt_idx*4+3] == self.selected_tile:
-                            painter.drawRect(col*0x10+8, row*0x10+8, 8, 8)
+            painter.setBrush(Qt.NoBrush)
+            painter.setOpacity(1.0)
+            painter.drawRects(rects)
 
         def mousePressEvent(self, event):
             super().mousePressEvent(event)
@@ -132,6 +128,8 @@ class MetatileEditWindow(QMainWindow):
                 if target_mt != 0xFF:
                     target_corner = int((x//8)%2+((y//8)%2)*2)
                     self.metatile_data[target_mt*4+target_corner] = self.selected_tile
+                    self.idxs_layer.invalidate()
+                    self.highlight_layer.invalidate()
                     self.update(x//8*8, y//8*8, 8, 8)
 
                     self.edited.emit(target_mt, target_corner)
@@ -139,6 +137,7 @@ class MetatileEditWindow(QMainWindow):
         @Slot(int)
         def tile_select_changed(self, tile):
             self.selected_tile = tile
+            self.highlight_layer.invalidate()
             if self.highlight_same_tiles:
                 self.update(self.sceneRect())
 
@@ -158,18 +157,25 @@ class MetatileEditWindow(QMainWindow):
 
         def area_changed(self, gfx, pals, metatile_data, pal_idx=0):
             self.gfx = gfx
+            self.tiles = convert_tiles_from_bitplanes(gfx)
             self.pals = pals
             self.metatile_data = metatile_data
             self.pal_idx = pal_idx
+            self.idxs_layer.invalidate()
+            self.highlight_layer.invalidate()
 
             self.tile_images = []
-            pal = convert_palette(put_palette_strings(pals[0]), 'src/palette.pal', transparent=False)
+            pal = strings_to_color_table(pals[0], 'src/palette.pal', transparent=False)
             for i in range(0x100):
-                self.tile_images.append(gfx_2_qimage(gfx, pal, width=1, idxs=[i], pal_per_tile=[pal_idx]))
+                self.tile_images.append(tiles_2_qimage(self.tiles, pal, width=1, idxs=[i], pal_per_tile=[pal_idx]))
+            self.tile_pixmaps = [QPixmap.fromImage(tile_image) for tile_image in self.tile_images]
             self.update(self.sceneRect())
 
-        def colors_changed(self, pals):
-            self.area_changed(self.gfx, pals, self.metatile_data, self.pal_idx)
+        def colors_changed(self, color_table):
+            for tile_image in self.tile_images:
+                tile_image.setColorTable(color_table)
+            self.tile_pixmaps = [QPixmap.fromImage(tile_image) for tile_image in self.tile_images]
+            self.update(self.sceneRect())
 
     class MetatileEditView(QGraphicsView):
         def __init__(self, scene, parent=None):
@@ -225,6 +231,6 @@ class MetatileEditWindow(QMainWindow):
         self.tile_select.area_changed(gfx, pal)
         self.mt_edit.area_changed(gfx, pal, metatile_data)
 
-    def colors_changed(self, pals):
-        self.tile_select.colors_changed(pals)
-        self.mt_edit.colors_changed(pals)
+    def colors_changed(self, color_table):
+        self.tile_select.colors_changed(color_table)
+        self.mt_edit.colors_changed(color_table)
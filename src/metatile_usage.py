@@ -0,0 +1,42 @@
+class MetatileUsageIndex:
+    '''Where each metatile is used in the rooms of an area, as (room, cell) pairs, so a metatile edit only repaints those cells.
+    An area is indexed the first time it's queried, then kept up to date as rooms are painted or added'''
+
+    def __init__(self, rooms_data):
+        self.rooms_data = rooms_data # dict keyed by area, owned by MainWindow
+
+        self.usages = {}
+        self.tilemaps = {} # the tilemaps as last indexed, to know what an edited cell used to be
+
+    def area_usages(self, area):
+        if area not in self.usages:
+            self.usages[area] = {}
+            self.tilemaps[area] = []
+
+        # Rooms added since the last query
+        rooms = self.rooms_data[area]
+        usages = self.usages[area]
+        tilemaps = self.tilemaps[area]
+        for room_idx in range(len(tilemaps), len(rooms)):
+            tilemap = rooms[room_idx]['tilemap'].tolist()
+            for mt_loc, mt_idx in enumerate(tilemap):
+                usages.setdefault(mt_idx, set()).add((room_idx, mt_loc))
+            tilemaps.append(tilemap)
+        return usages
+
+    def find(self, area, mt_idx):
+        '''Sorted (room, cell) pairs using the metatile'''
+        return sorted(self.area_usages(area).get(mt_idx, ()))
+
+    def cell_edited(self, area, room_idx, x, y):
+        '''Moves the cell at pixel (x, y) of a room to the usages of the metatile it has now'''
+        if area not in self.usages:
+            return
+        usages = self.area_usages(area)
+        mt_loc = x//0x10+y//0x10*0x10
+        tilemap = self.tilemaps[area][room_idx]
+        mt_idx = int(self.rooms_data[area][room_idx]['tilemap'][mt_loc])
+        if tilemap[mt_loc] != mt_idx:
+            usages[tilemap[mt_loc]].discard((room_idx, mt_loc))
+            usages.setdefault(mt_idx, set()).add((room_idx, mt_loc))
+            tilemap[mt_loc] = mt_idx
@@ -0,0 +1,56 @@
+class ObjCodec:
+    '''Converts objects to and from their bytes in the ROM, with tables compiled once from an obj_types dict
+    (local_obj_types.json or global_obj_types.json) instead of searching it for every object'''
+    def __init__(self, obj_types: dict):
+        # Type name by the low nibble of the first byte, the last type wins if two share one
+        self.types = [None]*0x10
+        self.sizes = {}
+        self.decoders = {}
+        self.encoders = {}
+        for obj_type, info in obj_types.items():
+            self.types[info['type'] & 0xF] = obj_type
+            self.sizes[obj_type] = len(info['props'])
+
+            # (byte, prop name, shifts, mask) in the order the props are in the JSON
+            self.decoders[obj_type] = [
+                (byte_i, prop_name, prop['shifts'], (1 << prop['len'])-1)
+                for byte_i, props_in_byte in enumerate(info['props'])
+                for prop_name, prop in props_in_byte.items()
+            ]
+
+            # (byte, prop name, mask, dropped bits, shifts): props go in as is,
+            # positions are pixels that only keep their top len bits
+            fields = []
+            for byte_i, props_in_byte in enumerate(info['props']):
+                for prop_name, prop in props_in_byte.items():
+                    if prop_name == 'x' or prop_name == 'y':
+                        fields.append((byte_i, prop_name, 0xFF, 8-prop['len'], prop['shifts']))
+                    else:
+                        fields.append((byte_i, prop_name, -1, 0, prop['shifts']))
+            self.encoders[obj_type] = (info['type'], len(info['props']), fields)
+
+    def obj_type(self, control):
+        obj_type = self.types[control & 0xF]
+        if obj_type is None:
+            raise ValueError(f'Unknown object type {control & 0xF:X}')
+        return obj_type
+
+    def size(self, control):
+        '''Number of bytes of the object starting with control, control included'''
+        return self.sizes[self.obj_type(control)]
+
+    def decode(self, data):
+        '''Type name and props of an object from its bytes, x and y are the raw fields'''
+        obj_type = self.obj_type(data[0])
+        props = {}
+        for byte_i, prop_name, shifts, mask in self.decoders[obj_type]:
+            props[prop_name] = (data[byte_i] >> shifts) & mask
+        return obj_type, props
+
+    def encode(self, obj):
+        '''Bytes of an object dict with obj_type, x, y and its props'''
+        type_id, size, fields = self.encoders[obj['obj_type']]
+        out = [type_id]+[0]*(size-1)
+        for byte_i, prop_name, mask, dropped_bits, shifts in fields:
+            out[byte_i] |= ((obj[prop_name] & mask) >> dropped_bits) << shifts
+        return out
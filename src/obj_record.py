@@ -0,0 +1,54 @@
+class ObjRecord:
+    '''An object in a room or in an area's global object list: its type, its position and the rest of its props by name.
+    Iterating gives (name, value) pairs in the same order as the object's JSON'''
+    __slots__ = ('obj_type', 'x', 'y', 'props')
+
+    FIELDS = ('obj_type', 'x', 'y')
+
+    def __init__(self, obj_type, x, y, props=None):
+        self.obj_type = obj_type
+        self.x = x
+        self.y = y
+        self.props = {} if props is None else props
+
+    @classmethod
+    def from_items(cls, items):
+        '''From (name, value) pairs, like a JSON object's items'''
+        props = dict(items)
+        return cls(props.pop('obj_type'), props.pop('x'), props.pop('y'), props)
+
+    @classmethod
+    def from_dict(cls, obj):
+        return cls.from_items(obj.items())
+
+    def to_dict(self):
+        return dict(self)
+
+    def copy(self):
+        return ObjRecord(self.obj_type, self.x, self.y, dict(self.props))
+
+    def __iter__(self):
+        yield 'obj_type', self.obj_type
+        yield 'x', self.x
+        yield 'y', self.y
+        yield from self.props.items()
+
+    def __len__(self):
+        return len(ObjRecord.FIELDS)+len(self.props)
+
+    def __repr__(self):
+        return f'ObjRecord({self.obj_type!r}, {self.x}, {self.y}, {self.props!r})'
+
+    def names(self):
+        return [*ObjRecord.FIELDS, *self.props]
+
+    def get(self, name):
+        if name in ObjRecord.FIELDS:
+            return getattr(self, name)
+        return self.props[name]
+
+    def set(self, name, value):
+        if name in ObjRecord.FIELDS:
+            setattr(self, name, value)
+        else:
+            self.props[name] = value
@@ -2,20 +2,36 @@ from PySide6.QtCore import Qt, Signal, Slot, QPointF, QRectF, QAbstractListModel
 from PySide6.QtGui import QPainter, QBrush, QPen, QFont
 from PySide6.QtWidgets import *
 from src.main_application import MainApplication
-import copy, json, math
+from src.obj_record import ObjRecord
+import json, math
 
 class ObjectGraphicsItem(QGraphicsItem):
     def __init__(self, obj_data, idx, local=True, parent=None):
         super().__init__(parent)
-        self.obj_data = obj_data
-        self.idx = idx
         self.local = local
-        if local:
-            self.setPos(obj_data[1][1], obj_data[2][1])
-        else:
-            self.setPos(obj_data[1][1], obj_data[2][1]//0x100*0xF0+(obj_data[2][1]&0xFF))
+        self.placing = False
+        self.set_obj(obj_data, idx)
         self.setFlags(QGraphicsItem.ItemIsMovable | QGraphicsItem.ItemIsFocusable | QGraphicsItem.ItemSendsGeometryChanges)
 
+    def set_obj(self, obj_data, idx):
+        '''Shows another record, for reusing the item'''
+        self.obj_data = obj_data
+        # Placed without itemChange writing the position back into the record
+        self.placing = True
+        if self.local:
+            self.setPos(obj_data.x, obj_data.y)
+        else:
+            self.setPos(obj_data.x, obj_data.y//0x100*0xF0+(obj_data.y&0xFF))
+        self.placing = False
+        self.set_idx(idx)
+
+    def set_idx(self, idx):
+        # Stacked in list order, like items added one after the other
+        self.idx = idx
+        if self.zValue() != idx:
+            self.setZValue(idx)
+        self.update()
+
     def paint(self, painter, option, widget):
         brush = QBrush(0xFFFFFF)
         painter.setBrush(brush)
@@ -42,11 +58,11 @@ class ObjectGraphicsItem(QGraphicsItem):
         if self.local:
             painter.setFont(QFont('monospace', 5, QFont.Bold))
             painter.drawText(-8, -8, 16, 16, Qt.AlignLeft | Qt.AlignTop, f'{self.idx:02X}')
-            painter.drawText(-8, 0, 16, 8, Qt.AlignLeft | Qt.AlignTop, str(self.obj_data[0][1]))
+            painter.drawText(-8, 0, 16, 8, Qt.AlignLeft | Qt.AlignTop, str(self.obj_data.obj_type))
         else:
             painter.setFont(QFont('monospace', 10, QFont.Bold))
             painter.drawText(-16, -16, 32, 32, Qt.AlignLeft | Qt.AlignTop, f'{self.idx:02X}')
-            painter.drawText(-16, 0, 32, 16, Qt.AlignLeft | Qt.AlignTop, str(self.obj_data[0][1]))
+            painter.drawText(-16, 0, 32, 16, Qt.AlignLeft | Qt.AlignTop, str(self.obj_data.obj_type))
 
     def boundingRect(self):
         if self.local:
@@ -55,12 +71,14 @@ class ObjectGraphicsItem(QGraphicsItem):
             return QRectF(-16, -16, 32, 32)
 
     def itemChange(self, change, value):
-        if change == QGraphicsItem.ItemPositionChange:
-            self.obj_data[1][1] = math.floor(value.x())
-            self.obj_data[2][1] = math.floor(value.y())
-            new_pos = QPointF(self.obj_data[1][1], self.obj_data[2][1])
+        if change == QGraphicsItem.ItemPositionChange and not self.placing:
+            self.obj_data.x = math.floor(value.x())
+            self.obj_data.y = math.floor(value.y())
+            new_pos = QPointF(self.obj_data.x, self.obj_data.y)
             if not self.local:
-                self.obj_data[2][1] = self.obj_data[2][1]//0xF0*0x100+(self.obj_data[2][1]%0xF0)
+                self.obj_data.y = self.obj_data.y//0xF0*0x100+(self.obj_data.y%0xF0)
+            if self.scene() is not None and new_pos != self.pos():
+                self.scene().obj_moved(self.idx)
             return new_pos
         return super().itemChange(change, value)
 
@@ -80,7 +98,56 @@ class ObjectGraphicsItem(QGraphicsItem):
         elif event.key() == Qt.Key_Down:
             self.setY(self.y() + (8 if MainApplication.app.keyboardModifiers() & Qt.ShiftModifier else 1))
 
+class ObjItemPool:
+    '''The ObjectGraphicsItems of a scene keyed by the record they show, so a new object list only adds and removes the items
+    of the records that came and went. Removed items are kept to show later records instead of creating new ones'''
+
+    def __init__(self, scene: QGraphicsScene, local=True):
+        self.scene = scene
+        self.local = local
+
+        self.items = [] # in object list order
+        self.by_record = {} # id(record) -> item, the item keeps the record alive
+        self.free = []
+        self.visible = True
+
+    def sync(self, objs):
+        '''Updates the items to objs and returns them in list order'''
+        kept = {}
+        for obj_data in objs:
+            item = self.by_record.pop(id(obj_data), None)
+            if item is not None:
+                kept[id(obj_data)] = item
+        for item in self.by_record.values():
+            self.scene.removeItem(item)
+            self.free.append(item)
+
+        self.items = []
+        for i, obj_data in enumerate(objs):
+            item = kept.get(id(obj_data))
+            if item is None:
+                if self.free:
+                    item = self.free.pop()
+                    item.set_obj(obj_data, i)
+                else:
+                    item = ObjectGraphicsItem(obj_data, i, self.local)
+                if item.isVisible() != self.visible:
+                    item.setVisible(self.visible)
+                self.scene.addItem(item)
+                kept[id(obj_data)] = item
+            elif item.idx != i:
+                item.set_idx(i)
+            self.items.append(item)
+        self.by_record = kept
+        return self.items
+
+    def set_visible(self, visible):
+        self.visible = visible
+        for item in self.items:
+            item.setVisible(visible)
+
 class ObjPropsModel(QAbstractTableModel):
+    '''Table of an ObjRecord's props, one row per prop name'''
     changed = Signal(int)
 
     def __init__(self, obj_data, obj_idx, obj_types, parent=None):
@@ -88,65 +155,65 @@ class ObjPropsModel(QAbstractTableModel):
         self.obj_data = obj_data
         self.obj_idx = obj_idx
         self.obj_types = obj_types
+        self.names = obj_data.names()
 
     def rowCount(self, parent):
-        return len(self.obj_data)
+        return len(self.names)
 
     def columnCount(self, parent):
         return 2
 
     def data(self, index: QModelIndex, role):
+        name = self.names[index.row()]
         if role == Qt.DisplayRole:
-            if index.column() == 1 and index.row() > 0:
-                return f'{self.obj_data[index.row()][1]:x}'
+            if index.column() == 0:
+                return name
+            elif index.row() > 0:
+                return f'{self.obj_data.get(name):x}'
             else:
-                return self.obj_data[index.row()][index.column()]
+                return self.obj_data.get(name)
         elif role == Qt.EditRole:
             if index.column() == 1:
-                return self.obj_data[index.row()][1]
+                return self.obj_data.get(name)
 
     def setData(self, index: QModelIndex, value, role):
         if role == Qt.EditRole:
-            self.obj_data[index.row()][1] = value
+            self.obj_data.set(self.names[index.row()], value)
             if index.row() == 0:
-                self.removeRows(3, len(self.obj_data)-3, QModelIndex())
-
-                new_props = []
-                for param_byte in self.obj_types[self.obj_data[0][1]]['props']:
-                    new_props.extend(prop for prop in param_byte)
-                if 'x' in new_props:
-                    new_props.remove('x')
-                if 'y' in new_props:
-                    new_props.remove('y')
-
-                self.insertRows(3, len(new_props), QModelIndex())
-                for i, prop in enumerate(new_props):
-                    self.obj_data[i+3][0] = prop
+                self.obj_type_changed()
 
             self.changed.emit(self.obj_idx)
             return True
         return False
 
+    def obj_type_changed(self):
+        '''Replaces the props after x and y with the new type's, set to 0'''
+        if self.obj_data.props:
+            self.beginRemoveRows(QModelIndex(), 3, len(self.names)-1)
+            self.obj_data.props = {}
+            self.names = self.obj_data.names()
+            self.endRemoveRows()
+
+        new_props = []
+        for param_byte in self.obj_types[self.obj_data.obj_type]['props']:
+            new_props.extend(prop for prop in param_byte)
+        if 'x' in new_props:
+            new_props.remove('x')
+        if 'y' in new_props:
+            new_props.remove('y')
+
+        if new_props:
+            self.beginInsertRows(QModelIndex(), 3, 3+len(new_props)-1)
+            self.obj_data.props = dict.fromkeys(new_props, 0)
+            self.names = self.obj_data.names()
+            self.endInsertRows()
+
     def flags(self, index: QModelIndex):
         if index.column() == 1:
             return Qt.ItemIsEditable | super().flags(index)
         else:
             return super().flags(index)
 
-    def insertRows(self, pos, rows, parent: QModelIndex = QModelIndex()):
-        self.beginInsertRows(QModelIndex(), pos, pos+rows-1)
-        for row in range(rows):
-            self.obj_data.insert(pos, ['', 0])
-        self.endInsertRows()
-        return True
-
-    def removeRows(self, pos, rows, parent: QModelIndex = QModelIndex()):
-        self.beginRemoveRows(QModelIndex(), pos, pos+rows-1)
-        for row in range(rows):
-            self.obj_data.pop(pos)
-        self.endRemoveRows()
-        return True
-
 class ObjPropsDelegate(QStyledItemDelegate):
     def __init__(self, obj_types, global_flag=False, parent=None):
         super().__init__(parent)
@@ -196,13 +263,13 @@ class ObjList(QListView):
 
         def data(self, index: QModelIndex, role):
             if role == Qt.DisplayRole:
-                return f'{index.row():02X}: {self.objs[index.row()][0][1]}'
+                return f'{index.row():02X}: {self.objs[index.row()].obj_type}'
             elif role == Qt.EditRole:
-                return copy.deepcopy(self.objs[index.row()])
+                return self.objs[index.row()]
 
         def setData(self, index: QModelIndex, value, role):
             if role == Qt.EditRole:
-                self.objs[index.row()] = copy.deepcopy(value)
+                self.objs[index.row()] = value
                 return True
             return False
 
@@ -222,7 +289,7 @@ class ObjList(QListView):
             to_json = []
             for index in indices:
                 if index.isValid():
-                    to_json.append(self.objs[index.row()])
+                    to_json.append(self.objs[index.row()].to_dict())
 
             mime_data = QMimeData()
             mime_data.setData('application/vnd.text.list', bytearray(json.dumps(to_json), 'utf8'))
@@ -248,7 +315,7 @@ class ObjList(QListView):
             objs = json.loads(str(data.data('application/vnd.text.list'), 'utf8'))
             self.insertRows(begin_row, len(objs), QModelIndex())
             for i, obj in enumerate(objs):
-                self.setData(self.index(begin_row+i, 0, QModelIndex()), obj, Qt.EditRole)
+                self.setData(self.index(begin_row+i, 0, QModelIndex()), ObjRecord.from_dict(obj), Qt.EditRole)
 
             self.changed.emit(self.objs)
             return True
@@ -256,11 +323,7 @@ class ObjList(QListView):
         def insertRows(self, pos, rows, parent: QModelIndex = QModelIndex()):
             self.beginInsertRows(QModelIndex(), pos, pos+rows-1)
             for row in range(rows):
-                self.objs.insert(pos, [
-                    ['obj_type', ''],
-                    ['x', 0x80],
-                    ['y', 0x80]
-                ])
+                self.objs.insert(pos, ObjRecord('', 0x80, 0x80))
             self.endInsertRows()
             self.changed.emit(self.objs)
             return True
@@ -0,0 +1,36 @@
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QImage, QPainter, QPixmap
+import math
+
+class OverlayLayer:
+    '''Transparent layer over a width x height scene, drawn by draw(painter) once and then blitted by every paint until invalidate().
+    It's drawn at the scale of the painter it's painted with, so text and lines are as sharp as if drawn directly'''
+
+    def __init__(self, width, height, draw):
+        self.width = width
+        self.height = height
+        self.draw = draw
+
+        self.pixmap = None
+        self.key = None
+
+    def invalidate(self):
+        self.pixmap = None
+
+    def paint(self, painter: QPainter):
+        scale = painter.worldTransform().m11()
+        device = painter.device()
+        key = (scale, device.logicalDpiX(), device.logicalDpiY())
+        if self.pixmap is None or key != self.key:
+            image = QImage(math.ceil(self.width*scale), math.ceil(self.height*scale), QImage.Format_ARGB32_Premultiplied)
+            image.fill(0)
+            # Same DPI as the device, for fonts sized in points
+            image.setDotsPerMeterX(round(device.logicalDpiX()/0.0254))
+            image.setDotsPerMeterY(round(device.logicalDpiY()/0.0254))
+            layer_painter = QPainter(image)
+            layer_painter.scale(scale, scale)
+            self.draw(layer_painter)
+            layer_painter.end()
+            self.pixmap = QPixmap.fromImage(image)
+            self.key = key
+        painter.drawPixmap(QRectF(0, 0, self.width, self.height), self.pixmap, QRectF(self.pixmap.rect()))
@@ -1,30 +1,40 @@
+import numpy as np
+
+master_palettes = {}
+color_tables = {}
+
+def load_master_palette(fp):
+    '''Returns the colors of a .pal file as an array of 0xAARRGGBB values. Each file is only read once'''
+    if fp not in master_palettes:
+        with open(fp, 'rb') as pal_file:
+            data = pal_file.read()
+        rgb = np.frombuffer(data, dtype=np.uint8, count=len(data)//3*3).reshape(-1, 3).astype(np.uint32)
+        master_palettes[fp] = 0xFF000000 | (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+    return master_palettes[fp]
+
 def convert_palette(idxs, fp, transparent=True):
-    with open(fp, 'rb') as pal_file:
-        converted_pal = []
-        i = 0
-        for idx in idxs:
-            if i & 3 == 0:
-                if transparent:
-                    converted_pal += [0x00000000]
-                elif len(converted_pal) == 0:
-                    pal_file.seek(idx*3)
-                    converted_pal.append(int.from_bytes(pal_file.read(3), 'big') + 0xFF000000)
-                else:
-                    converted_pal += [converted_pal[0]]
-            else:
-                pal_file.seek(idx*3)
-                converted_pal.append(int.from_bytes(pal_file.read(3), 'big') + 0xFF000000)
-            i += 1
-    return converted_pal
+    converted_pal = load_master_palette(fp)[np.asarray(idxs, dtype=np.intp)]
+    # The first color of every palette is the shared background color
+    converted_pal[::4] = 0x00000000 if transparent else converted_pal[0]
+    return converted_pal.tolist()
+
+def palette_key(strings):
+    '''Hashable form of a palette's strings, equal for palettes with the same contents'''
+    return tuple((string['start'], tuple(string['data'])) for string in strings)
+
+def strings_to_color_table(strings, fp, transparent=True):
+    '''Same as convert_palette(put_palette_strings(strings), fp, transparent), cached by the palette's contents'''
+    key = (palette_key(strings), fp, transparent)
+    if key not in color_tables:
+        color_tables[key] = convert_palette(put_palette_strings(strings), fp, transparent)
+    return list(color_tables[key])
 
 def generate_colors(fp):
-    colors = []
-    with open(fp, 'rb') as pal_file:
-        for _ in range(0x40):
-            colors.append(int.from_bytes(pal_file.read(3), 'big') + 0xFF000000)
-    return colors
+    return load_master_palette(fp)[:0x40].tolist()
 
-def put_palette_strings(strings, pal=[0x0F]*0x20):
+def put_palette_strings(strings, pal=None):
+    if pal is None:
+        pal = [0x0F]*0x20
     for string in strings:
         for i in range(len(string['data'])):
             pal[string['start']+i] = string['data'][i]
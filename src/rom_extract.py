@@ -1,17 +1,22 @@
-import base64, json, romfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse, base64, json, obj_codec, os, romfile, time
 
 def extract_palette(addr):
-    rom.seek(addr)
+    buf = rom.view(addr)
+    pos = 0
     palette = []
     while True:
-        if rom.read_int(1) == 0: # terminator
+        if buf[pos] == 0: # terminator
             break
-        start = rom.read_int(1)
-        n = rom.read_int(1) & 0x7F
+        start = buf[pos+1]
+        n = buf[pos+2] & 0x7F
+        pos += 3
         if n & 0x40: # fill
-            data = [rom.read_int(1)]*(n & 0x3F)
+            data = [buf[pos]]*(n & 0x3F)
+            pos += 1
         else: # copy
-            data = [rom.read_int(1) for _ in range(n)]
+            data = list(buf[pos:pos+n])
+            pos += n
         palette.append({
             'start': start,
             'data': data
@@ -21,37 +26,25 @@ def extract_palette(addr):
 
 def extract_structs(addr, n):
     structs = []
-    for i in range(n):
+    for ptr in rom.array(addr, n, '<u2'):
         struct = []
-        rom.seek(addr+i*2)
-        rom.seek((addr&0xFF0000)+rom.read_int(2))
+        buf = rom.view((addr&0xFF0000)+int(ptr))
+        pos = 0
 
         while True:
-            n = rom.read_int(1)
+            n = buf[pos]
             if n == 0xFF:
                 break
-            struct.append([n >> 4] + [rom.read_int(1) for _ in range(0x10 if n & 0xF == 0 else n & 0xF)])
+            length = 0x10 if n & 0xF == 0 else n & 0xF
+            struct.append([n >> 4] + list(buf[pos+1:pos+1+length]))
+            pos += 1+length
 
         structs.append(struct)
 
     return structs
 
-def get_num_obj_params(control, types: dict):
-    for k, v in types.items():
-        if v['type'] == control & 0xF:
-            return len(v['props'])-1
-
-def convert_obj_data(obj, types: dict, room_x=0, room_y=0):
-    for k, v in types.items():
-        if v['type'] == obj[0] & 0xF:
-            obj_type = k
-
-    props = {}
-
-    for param_i, param in enumerate(obj):
-        for prop_name, info in types[obj_type]['props'][param_i].items():
-            prop = (param >> info['shifts']) % (1 << info['len'])
-            props[prop_name] = prop
+def convert_obj_data(obj, codec: obj_codec.ObjCodec, room_x=0, room_y=0):
+    obj_type, props = codec.decode(obj)
 
     match obj_type:
         case 'enemy':
@@ -95,33 +88,38 @@ def convert_obj_data(obj, types: dict, room_x=0, room_y=0):
 
     return data
 
-def extract_room(addr, structs, obj_types: dict):
-    rom.seek(addr)
-    room_pal = rom.read_int(1)
+def extract_room(addr, structs, codec: obj_codec.ObjCodec):
+    buf = rom.view(addr)
+    room_pal = buf[0]
+    pos = 1
 
     tilemap = [0xFF]*0xF0
     attrs = [room_pal]*0x100
     objs = []
 
     while True:
-        pos = rom.read_int(1)
-        if pos == 0xFF:
+        struct_pos = buf[pos]
+        pos += 1
+        if struct_pos == 0xFF:
             break
-        elif pos == 0xFE:
+        elif struct_pos == 0xFE:
             continue
-        elif pos == 0xFD:
+        elif struct_pos == 0xFD:
             while True:
-                control = rom.read_int(1)
+                control = buf[pos]
+                pos += 1
                 if control == 0xFF:
                     break
 
-                num_params = get_num_obj_params(control, obj_types)
-                objs.append(convert_obj_data([control] + [rom.read_int(1) for _ in range(num_params)], obj_types))
+                num_params = codec.size(control)-1
+                objs.append(convert_obj_data(buf[pos-1:pos+num_params], codec))
+                pos += num_params
             break
-        x_pos = pos & 0xF
-        y_pos = pos >> 4
-        struct_i = rom.read_int(1)
-        pal = rom.read_int(1)
+        x_pos = struct_pos & 0xF
+        y_pos = struct_pos >> 4
+        struct_i = buf[pos]
+        pal = buf[pos+1]
+        pos += 2
 
         for row in structs[struct_i]:
             if y_pos >= 0xF:
@@ -143,23 +141,28 @@ def extract_room(addr, structs, obj_types: dict):
         'objs': objs
     }
 
-def extract_global_objs(addr, obj_types: dict):
-    rom.seek(addr)
+def extract_global_objs(addr, codec: obj_codec.ObjCodec):
+    buf = rom.view(addr)
+    pos = 0
     objs = []
     obj_i = 0
     while True:
-        y = rom.read_int(1)
-        next_row_ptr = rom.read_int(2)
+        y = buf[pos]
+        next_row_ptr = buf[pos+1] | (buf[pos+2] << 8)
+        pos += 3
         while True:
-            x = rom.read_int(1)
-            next_col = rom.read_int(1)
+            x = buf[pos]
+            next_col = buf[pos+1]
+            pos += 2
             while True:
-                control = rom.read_int(1)
+                control = buf[pos]
+                pos += 1
                 if control == 0:
                     break
 
-                num_params = get_num_obj_params(control, obj_types)
-                objs.append(convert_obj_data([control] + [rom.read_int(1) for _ in range(num_params)], obj_types, x, y))
+                num_params = codec.size(control)-1
+                objs.append(convert_obj_data(buf[pos-1:pos+num_params], codec, x, y))
+                pos += num_params
             if next_col == 0xFF:
                 break
         if next_row_ptr == 0xFFFF:
@@ -167,51 +170,117 @@ def extract_global_objs(addr, obj_types: dict):
 
     return objs
 
-if __name__ == '__main__':
-    rom = romfile.ROMFile('M1.nes')
-    local_obj_types = json.load(open('data/local_obj_types.json', 'r'))
-    global_obj_types = json.load(open('data/global_obj_types.json', 'r'))
-
-    area_data = [
-        ('brinstar', 0x10000, 0x32, 0x2F),
-        ('norfair', 0x20000, 0x31, 0x2E),
-        ('tourian', 0x30000, 0x20, 0x15),
-        ('kraid', 0x40000, 0x27, 0x25),
-        ('ridley', 0x50000, 0x1D, 0x2A),
-    ]
+# name, bank, number of structs, number of rooms
+AREA_DATA = [
+    ('brinstar', 0x10000, 0x32, 0x2F),
+    ('norfair', 0x20000, 0x31, 0x2E),
+    ('tourian', 0x30000, 0x20, 0x15),
+    ('kraid', 0x40000, 0x27, 0x25),
+    ('ridley', 0x50000, 0x1D, 0x2A),
+]
+
+def extract_world_map(rom_path, out_path):
+    global rom
+    rom = romfile.ROMFile(rom_path)
 
     rom.seek(0x0A53E)
-    with open(f'data/world_map.bin', 'wb') as world_map_file:
+    with open(os.path.join(out_path, 'world_map.bin'), 'wb') as world_map_file:
         world_map_file.write(rom.read(0x400))
 
-    for area_name, bank, num_structs, num_rooms in area_data:
-        palettes = []
-        for i in range(0x1C):
-            rom.seek(bank+0x9560+i*2)
-            palettes.append(extract_palette(bank+rom.read_int(2)))
-        with open(f'data/{area_name}/palettes.json', 'w') as json_file:
-            json.dump(palettes, json_file, indent=1)
-        
-        rom.seek(bank+0x959E)
-        rom.seek(bank+rom.read_int(2))
-        metatiles = bytearray(rom.read(0x40*4))
-        metatiles.extend(b'\xFF'*(0xC0*4))
-        with open(f'data/{area_name}/metatiles.bin', 'wb') as metatiles_file:
-            metatiles_file.write(metatiles)
-
-        rom.seek(bank+0x959C)
-        structs = extract_structs(bank+rom.read_int(2), num_structs)
-
-        rom.seek(bank+0x959A)
-        room_ptr_tbl = bank+rom.read_int(2)
-
-        rooms = []
-        for i in range(num_rooms):
-            rom.seek(room_ptr_tbl+i*2)
-            rooms.append(extract_room(bank+rom.read_int(2), structs, local_obj_types))
-        with open(f'data/{area_name}/rooms.json', 'w') as json_file:
-            json.dump(rooms, json_file, indent=1)
-
-        with open(f'data/{area_name}/global_objs.json', 'w') as json_file:
-            rom.seek(bank+0x9598)
-            json.dump(extract_global_objs(bank+rom.read_int(2), global_obj_types), json_file, indent=1)
+def extract_area(rom_path, out_path, area, local_obj_types, global_obj_types):
+    '''Extracts one area into out_path/<area name>, with its own mapping of the ROM so areas can be extracted in separate processes.
+    Returns how long it took in seconds'''
+    global rom
+    start = time.perf_counter()
+    rom = romfile.ROMFile(rom_path)
+    area_name, bank, num_structs, num_rooms = area
+    area_path = os.path.join(out_path, area_name)
+    os.makedirs(os.path.join(area_path, 'rooms'), exist_ok=True)
+
+    palettes = [extract_palette(bank+int(ptr)) for ptr in rom.array(bank+0x9560, 0x1C, '<u2')]
+    with open(os.path.join(area_path, 'palettes.json'), 'w') as json_file:
+        json.dump(palettes, json_file, indent=1)
+
+    rom.seek(bank+0x959E)
+    rom.seek(bank+rom.read_int(2))
+    metatiles = bytearray(rom.read(0x40*4))
+    metatiles.extend(b'\xFF'*(0xC0*4))
+    with open(os.path.join(area_path, 'metatiles.bin'), 'wb') as metatiles_file:
+        metatiles_file.write(metatiles)
+
+    rom.seek(bank+0x959C)
+    structs = extract_structs(bank+rom.read_int(2), num_structs)
+
+    rom.seek(bank+0x959A)
+    room_ptr_tbl = bank+rom.read_int(2)
+
+    local_codec = obj_codec.ObjCodec(local_obj_types)
+    rooms = [extract_room(bank+int(ptr), structs, local_codec) for ptr in rom.array(room_ptr_tbl, num_rooms, '<u2')]
+    with open(os.path.join(area_path, 'rooms.json'), 'w') as json_file:
+        json.dump(rooms, json_file, indent=1)
+
+    with open(os.path.join(area_path, 'global_objs.json'), 'w') as json_file:
+        rom.seek(bank+0x9598)
+        json.dump(extract_global_objs(bank+rom.read_int(2), obj_codec.ObjCodec(global_obj_types)), json_file, indent=1)
+
+    return time.perf_counter()-start
+
+def extract(rom_path, out_path, area_data=AREA_DATA, local_obj_types=None, global_obj_types=None, max_workers=None):
+    '''Extracts the world map and every area of a ROM into out_path, areas in parallel on a process pool.
+    The object types default to the ones already in out_path.
+    Returns the seconds taken by each area and a list of (area name, error message) for the areas that failed'''
+    if local_obj_types is None:
+        with open(os.path.join(out_path, 'local_obj_types.json'), 'r') as f:
+            local_obj_types = json.load(f)
+    if global_obj_types is None:
+        with open(os.path.join(out_path, 'global_obj_types.json'), 'r') as f:
+            global_obj_types = json.load(f)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    extract_world_map(rom_path, out_path)
+
+    timings = {}
+    failures = []
+    if max_workers <= 1 or len(area_data) <= 1:
+        for area in area_data:
+            try:
+                timings[area[0]] = extract_area(rom_path, out_path, area, local_obj_types, global_obj_types)
+            except Exception as e:
+                failures.append((area[0], str(e) or type(e).__name__))
+        return timings, failures
+
+    with ProcessPoolExecutor(min(max_workers, len(area_data))) as pool:
+        futures = {pool.submit(extract_area, rom_path, out_path, area, local_obj_types, global_obj_types): area[0] for area in area_data}
+        for future in as_completed(futures):
+            try:
+                timings[futures[future]] = future.result()
+            except Exception as e:
+                failures.append((futures[future], str(e) or type(e).__name__))
+    return timings, failures
+
+def load_area_data(fp):
+    '''Reads an area table from a JSON list of [name, bank, number of structs, number of rooms],
+    numbers can also be strings like "0x10000"'''
+    with open(fp, 'r') as f:
+        return [(name, *(int(n, 0) if isinstance(n, str) else n for n in numbers)) for name, *numbers in json.load(f)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extracts the world map, palettes, metatiles, rooms and global objects of a ROM into an editor data folder')
+    parser.add_argument('rom', nargs='?', default='M1.nes', help='ROM to extract from (default: M1.nes)')
+    parser.add_argument('-o', '--output', default='data', help='data folder to extract into, with the object type JSON files already in it (default: data)')
+    parser.add_argument('-a', '--areas', help='JSON file with the area table, a list of [name, bank, number of structs, number of rooms] (default: the vanilla areas)')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    area_data = load_area_data(args.areas) if args.areas else AREA_DATA
+    timings, failures = extract(args.rom, args.output, area_data, max_workers=args.jobs)
+
+    for area_name, seconds in sorted(timings.items(), key=lambda timing: timing[1], reverse=True):
+        print(f'{area_name}: {seconds*1000:.1f} ms')
+    print(f'Extracted {len(timings)}/{len(area_data)} areas from {args.rom} in {(time.perf_counter()-start)*1000:.1f} ms')
+    for area_name, error in failures:
+        print(f'Failed to extract {area_name}: {error}')
+    if failures:
+        raise SystemExit(1)
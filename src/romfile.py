@@ -1,18 +1,37 @@
+import mmap
+import numpy as np
+
 class ROMFile:
     nes2hex = lambda n: (n // 0x10000 * 0x4000) + (n % 0x4000) + 0x10
     hex2nes = lambda n: ((n - 0x10) // 0x4000 * 0x10000) + ((n - 0x10) % 0x4000) + 0x8000
 
     def __init__(self, fp):
-        self.file = open(fp, 'rb')
+        # The whole ROM is mapped once, reads are slices of it instead of file reads
+        with open(fp, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.mmap)
+        self.pos = 0
+
+    def view(self, addr, n=None):
+        '''memoryview of n bytes at addr, or of everything from addr to the end of the ROM, without copying'''
+        start = ROMFile.nes2hex(addr)
+        return self.data[start:] if n is None else self.data[start:start+n]
+
+    def array(self, addr, n, dtype=np.uint8):
+        '''numpy array of n values of dtype at addr, without copying'''
+        return np.frombuffer(self.data, dtype=dtype, count=n, offset=ROMFile.nes2hex(addr))
 
     def read(self, n):
-        return self.file.read(n)
+        out = self.data[self.pos:self.pos+n]
+        self.pos += n
+        return out
 
     def read_int(self, n):
         return int.from_bytes(self.read(n), 'little')
 
     def seek(self, addr):
-        return self.file.seek(ROMFile.nes2hex(addr))
+        self.pos = ROMFile.nes2hex(addr)
+        return self.pos
 
     def tell(self):
-        return ROMFile.hex2nes(self.file.tell())
+        return ROMFile.hex2nes(self.pos)
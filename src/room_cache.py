@@ -0,0 +1,56 @@
+from src import lzsa1
+import hashlib, os
+
+class CompressedRoomCache:
+    '''Compressed rooms on disk, keyed by a hash of the uncompressed room and the compressor version.
+    The least recently used entries are deleted once the cache grows past max_size bytes'''
+    def __init__(self, path, max_size=0x400000):
+        self.path = path
+        self.max_size = max_size
+
+    def entry_path(self, data):
+        key = hashlib.sha256(f'lzsa1-{lzsa1.VERSION}-raw'.encode() + b'\0' + bytes(data)).hexdigest()
+        return os.path.join(self.path, f'{key}.bin')
+
+    def get(self, data):
+        '''The compressed room, or None if it isn't cached or the entry doesn't decompress back to data'''
+        path = self.entry_path(data)
+        try:
+            with open(path, 'rb') as f:
+                block = f.read()
+        except FileNotFoundError:
+            return None
+
+        # A stale or corrupted entry is deleted instead of ending up in a build
+        try:
+            valid = lzsa1.decompress(block) == bytes(data)
+        except (IndexError, ValueError):
+            valid = False
+        if not valid:
+            os.remove(path)
+            return None
+
+        os.utime(path) # most recently used
+        return block
+
+    def put(self, data, block):
+        path = self.entry_path(data)
+        os.makedirs(self.path, exist_ok=True)
+        with open(path+'.part', 'wb') as f:
+            f.write(block)
+        os.replace(path+'.part', path)
+
+    def evict(self):
+        '''Deletes the least recently used entries until the cache fits in max_size'''
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and entry.name.endswith('.bin'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(path)
+            size -= entry_size
@@ -0,0 +1,50 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src import lzsa1
+import multiprocessing, os
+
+def compress_rooms(jobs, max_workers=None, cache=None):
+    '''Compresses (key, room bytes) jobs on a pool of worker processes, passing the bytes in memory.
+    Rooms found in the cache (a CompressedRoomCache) aren't compressed again, and new ones are added to it.
+    Returns a dict of compressed blocks by key and a list of (key, error message) for the jobs that failed'''
+    if cache is not None:
+        compressed = {}
+        misses = []
+        for key, data in jobs:
+            block = cache.get(data)
+            if block is None:
+                misses.append((key, data))
+            else:
+                compressed[key] = block
+
+        new_blocks, failures = compress_rooms(misses, max_workers)
+        for key, data in misses:
+            if key in new_blocks:
+                cache.put(data, new_blocks[key])
+        if new_blocks:
+            cache.evict()
+        compressed.update(new_blocks)
+        return compressed, failures
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    compressed = {}
+    failures = []
+
+    # Starting workers costs more than compressing a handful of rooms
+    if max_workers <= 1 or len(jobs) <= 4:
+        for key, data in jobs:
+            try:
+                compressed[key] = lzsa1.compress(data)
+            except Exception as e:
+                failures.append((key, str(e)))
+        return compressed, failures
+
+    # spawn instead of fork, since forking a process running Qt isn't safe
+    with ProcessPoolExecutor(min(max_workers, len(jobs)), mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(lzsa1.compress, bytes(data)): key for key, data in jobs}
+        for future in as_completed(futures):
+            try:
+                compressed[futures[future]] = future.result()
+            except Exception as e:
+                failures.append((futures[future], str(e) or type(e).__name__))
+    return compressed, failures
@@ -1,18 +1,19 @@
 from PySide6.QtCore import Qt, Signal, Slot, QAbstractListModel, QAbstractTableModel, QModelIndex, QMimeData
 from PySide6.QtGui import QImage, QPainter, QBrush, QPen, QFont
 from PySide6.QtWidgets import *
-from src.pal_utils import convert_palette, put_palette_strings
-from src.twobpp import gfx_2_qimage
-from src.obj_widgets import ObjectGraphicsItem, ObjPropsModel, ObjPropsDelegate, ObjList
+from src.obj_widgets import ObjItemPool, ObjPropsModel, ObjPropsDelegate, ObjList
+from src.overlay_layer import OverlayLayer
+from src.label_atlas import draw_labels
+import numpy as np
 
 class RoomEditWindow(QMainWindow):
     class MetatileSelect(QGraphicsScene):
         changed = Signal(int)
 
-        def __init__(self, gfx, pals, metatile_data, parent=None):
+        def __init__(self, area, mt_images, metatile_data, parent=None):
             super().__init__(0, 0, 256, 256, parent)
-            self.gfx = gfx
-            self.pals = pals
+            self.area = area
+            self.mt_images = mt_images
             self.metatile_data = metatile_data
 
             # Cursor at selected metatile
@@ -20,26 +21,27 @@ class RoomEditWindow(QMainWindow):
             self.selected_mt_rect = QGraphicsRectItem(0, 0, 16, 16)
             self.addItem(self.selected_mt_rect)
 
+            self.idxs_layer = OverlayLayer(0x100, 0x100, self.draw_idxs)
             self.palette_changed(0)
             self.show_tile_idxs = False
 
         def drawBackground(self, painter: QPainter, rect):
             for row in range(0x10):
                 for col in range(0x10):
-                    painter.drawImage(col*0x10, row*0x10, self.mt_images[col+row*0x10])
+                    painter.drawPixmap(col*0x10, row*0x10, self.mt_images.pixmap(self.area, self.selected_pal, col+row*0x10))
             if self.show_tile_idxs:
-                pen = QPen((0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[self.selected_pal])
-                pen.setJoinStyle(Qt.MiterJoin)
-                painter.setPen(pen)
-                painter.setFont(QFont('monospace', 4, QFont.Bold))
-                for row in range(0x10):
-                    for col in range(0x10):
-                        mt_idx = col+row*0x10
-                        pen.setJoinStyle(Qt.MiterJoin)
-                        painter.drawText(col*0x10+1, row*0x10+6, f'{self.metatile_data[mt_idx*4]:02X}')
-                        painter.drawText(col*0x10+8+1, row*0x10+6, f'{self.metatile_data[mt_idx*4+1]:02X}')
-                        painter.drawText(col*0x10+1, row*0x10+6+8, f'{self.metatile_data[mt_idx*4+2]:02X}')
-                        painter.drawText(col*0x10+8+1, row*0x10+6+8, f'{self.metatile_data[mt_idx*4+3]:02X}')
+                self.idxs_layer.paint(painter)
+
+        def draw_idxs(self, painter: QPainter):
+            labels = []
+            for row in range(0x10):
+                for col in range(0x10):
+                    mt_idx = col+row*0x10
+                    labels.append((col*0x10+1, row*0x10+6, self.metatile_data[mt_idx*4]))
+                    labels.append((col*0x10+8+1, row*0x10+6, self.metatile_data[mt_idx*4+1]))
+                    labels.append((col*0x10+1, row*0x10+6+8, self.metatile_data[mt_idx*4+2]))
+                    labels.append((col*0x10+8+1, row*0x10+6+8, self.metatile_data[mt_idx*4+3]))
+            draw_labels(painter, QFont('monospace', 4, QFont.Bold), (0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[self.selected_pal], labels)
 
         def mousePressEvent(self, event):
             super().mousePressEvent(event)
@@ -54,17 +56,12 @@ class RoomEditWindow(QMainWindow):
         def palette_changed(self, pal_idx):
             self.selected_pal = pal_idx
 
-            # Generate metatile images
-            self.mt_images = []
-            pal = convert_palette(put_palette_strings(self.pals[0]), 'src/palette.pal', transparent=False)
-            for i in range(0x100):
-                self.mt_images.append(gfx_2_qimage(self.gfx, pal, width=2, idxs=self.metatile_data[i*4:i*4+4], pal_per_tile=[pal_idx]*4))
-
             # Cursor at selected metatile
             pen = QPen((0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[pal_idx])
             pen.setJoinStyle(Qt.MiterJoin)
             self.selected_mt_rect.setPen(pen)
 
+            self.idxs_layer.invalidate()
             self.update(self.sceneRect())
 
         @Slot(Qt.CheckState)
@@ -72,19 +69,17 @@ class RoomEditWindow(QMainWindow):
             self.show_tile_idxs = state == Qt.Checked
             self.update(self.sceneRect())
 
-        def area_changed(self, gfx, pals, metatile_data):
-            self.gfx = gfx
-            self.pals = pals
+        def area_changed(self, area, metatile_data):
+            self.area = area
             self.metatile_data = metatile_data
 
             self.palette_changed(self.selected_pal)
 
-        def colors_changed(self, pals):
-            self.area_changed(self.gfx, pals, self.metatile_data)
+        def colors_changed(self):
+            self.update(self.sceneRect())
 
         def metatile_edited(self, mt_idx):
-            pal = convert_palette(put_palette_strings(self.pals[0]), 'src/palette.pal', transparent=False)
-            self.mt_images[mt_idx] = gfx_2_qimage(self.gfx, pal, width=2, idxs=self.metatile_data[mt_idx*4:mt_idx*4+4], pal_per_tile=[self.selected_pal]*4)
+            self.idxs_layer.invalidate()
             self.update(mt_idx%0x10*0x10, mt_idx//0x10*0x10, 0x10, 0x10)
 
     class MetatileSelectView(QGraphicsView):
@@ -97,11 +92,17 @@ class RoomEditWindow(QMainWindow):
 
     class RoomEdit(QGraphicsScene):
         edited = Signal(int, int, int)
+        objs_edited = Signal(int)
 
-        def __init__(self, gfx, pals, metatile_data, rooms_data, parent=None):
+        def __init__(self, area, mt_images, metatile_data, rooms_data, parent=None):
             super().__init__(0, 0, 256, 240, parent)
 
-            self.area_changed(gfx, pals, metatile_data, rooms_data)
+            self.mt_images = mt_images
+            # Index text and highlights are drawn once into layers, redrawn when what they show changes
+            self.idxs_layer = OverlayLayer(0x100, 0xF0, self.draw_idxs)
+            self.highlight_layer = OverlayLayer(0x100, 0xF0, self.draw_highlights)
+            self.obj_items = ObjItemPool(self)
+            self.area_changed(area, metatile_data, rooms_data)
 
             self.selected_mt = 0
             self.selected_pal = 0
@@ -110,56 +111,61 @@ class RoomEditWindow(QMainWindow):
             self.highlight_same_mts = False
 
         def drawBackground(self, painter: QPainter, rect):
-            tm = self.rooms_data[self.current_room]['tilemap']
-            attrs = self.rooms_data[self.current_room]['attrs']
+            # Plain ints, since uint8 math like mt_idx*4 would wrap around
+            tm = self.rooms_data[self.current_room]['tilemap'].tolist()
+            attrs = self.rooms_data[self.current_room]['attrs'].tolist()
             for row in range(0xF):
                 for col in range(0x10):
-                    painter.drawImage(col*0x10, row*0x10, self.mt_images[attrs[col+row*0x10]][tm[col+row*0x10]])
+                    painter.drawPixmap(col*0x10, row*0x10, self.mt_images.pixmap(self.area, attrs[col+row*0x10], tm[col+row*0x10]))
 
-            pen = QPen(0x00FF00)
-            pen.setJoinStyle(Qt.MiterJoin)
-            painter.setPen(pen)
+            if self.show_tile_idxs or self.show_mt_idxs:
+                self.idxs_layer.paint(painter)
+            if self.highlight_same_mts:
+                self.highlight_layer.paint(painter)
+
+        def draw_idxs(self, painter: QPainter):
+            tm = self.rooms_data[self.current_room]['tilemap'].tolist()
+            attrs = self.rooms_data[self.current_room]['attrs'].tolist()
+            # Labels of each palette's color
+            labels = [[], [], [], []]
             if self.show_tile_idxs:
-                painter.setFont(QFont('monospace', 4, QFont.Bold))
+                font = QFont('monospace', 4, QFont.Bold)
                 for row in range(0xF):
                     for col in range(0x10):
                         mt_idx = tm[col+row*0x10]
-                        pen.setColor((0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[attrs[col+row*0x10]])
-                        painter.setPen(pen)
-                        painter.drawText(col*0x10+1, row*0x10+6, f'{self.metatile_data[mt_idx*4]:02X}')
-                        painter.drawText(col*0x10+8+1, row*0x10+6, f'{self.metatile_data[mt_idx*4+1]:02X}')
-                        painter.drawText(col*0x10+1, row*0x10+6+8, f'{self.metatile_data[mt_idx*4+2]:02X}')
-                        painter.drawText(col*0x10+8+1, row*0x10+6+8, f'{self.metatile_data[mt_idx*4+3]:02X}')
+                        pal_labels = labels[attrs[col+row*0x10]]
+                        pal_labels.append((col*0x10+1, row*0x10+6, self.metatile_data[mt_idx*4]))
+                        pal_labels.append((col*0x10+8+1, row*0x10+6, self.metatile_data[mt_idx*4+1]))
+                        pal_labels.append((col*0x10+1, row*0x10+6+8, self.metatile_data[mt_idx*4+2]))
+                        pal_labels.append((col*0x10+8+1, row*0x10+6+8, self.metatile_data[mt_idx*4+3]))
             elif self.show_mt_idxs:
-                painter.setFont(QFont('monospace', 8, QFont.Bold))
+                font = QFont('monospace', 8, QFont.Bold)
                 for row in range(0xF):
                     for col in range(0x10):
-                        pen.setColor((0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[attrs[col+row*0x10]])
-                        painter.setPen(pen)
-                        painter.drawText(col*0x10+1, row*0x10+12, f'{tm[col+row*0x10]:02X}')
-            if self.highlight_same_mts:
-                # workaround for Qt bug
-                brush = QBrush(0x00FF00)
-                painter.setBrush(brush)
-                pen.setStyle(Qt.NoPen)
+                        labels[attrs[col+row*0x10]].append((col*0x10+1, row*0x10+12, tm[col+row*0x10]))
+            for color, pal_labels in zip((0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF), labels):
+                if pal_labels:
+                    draw_labels(painter, font, color, pal_labels)
+
+        def draw_highlights(self, painter: QPainter):
+            room = self.rooms_data[self.current_room]
+            mt_locs = np.flatnonzero(room['tilemap'] == self.selected_mt).tolist()
+            colors = [(0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[attr] for attr in room['attrs'][mt_locs].tolist()]
+
+            # Fills at half opacity, then outlines over them (workaround for Qt bug)
+            painter.setPen(Qt.NoPen)
+            painter.setOpacity(0.5)
+            for mt_loc, color in zip(mt_locs, colors):
+                painter.setBrush(QBrush(color))
+                painter.drawRect(mt_loc%0x10*0x10, mt_loc//0x10*0x10, 0x10, 0x10)
+            painter.setBrush(Qt.NoBrush)
+            painter.setOpacity(1.0)
+            pen = QPen(0x00FF00)
+            pen.setJoinStyle(Qt.MiterJoin)
+            for mt_loc, color in zip(mt_locs, colors):
+                pen.setColor(color)
                 painter.setPen(pen)
-                painter.setOpacity(0.5)
-                for row in range(0xF):
-                    for col in range(0x10):
-                        if tm[col+row*0x10] == self.selected_mt:
-                            brush.setColor((0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[attrs[col+row*0x10]])
-                            painter.setBrush(brush)
-                            painter.drawRect(col*0x10, row*0x10, 0x10, 0x10)
-                brush.setStyle(Qt.NoBrush)
-                painter.setBrush(brush)
-                pen.setStyle(Qt.SolidLine)
-                painter.setOpacity(1.0)
-                for row in range(0xF):
-                    for col in range(0x10):
-                        if tm[col+row*0x10] == self.selected_mt:
-                            pen.setColor((0xFF0000, 0xFFFF00, 0x00FF00, 0x00FFFF)[attrs[col+row*0x10]])
-                            painter.setPen(pen)
-                            painter.drawRect(col*0x10, row*0x10, 0x10, 0x10)
+                painter.drawRect(mt_loc%0x10*0x10, mt_loc//0x10*0x10, 0x10, 0x10)
 
         def mousePressEvent(self, event):
             super().mousePressEvent(event)
@@ -178,6 +184,8 @@ class RoomEditWindow(QMainWindow):
                 target_mt_loc = int(x//0x10+y//0x10*0x10)
                 self.rooms_data[self.current_room]['tilemap'][target_mt_loc] = self.selected_mt
                 self.rooms_data[self.current_room]['attrs'][target_mt_loc] = self.selected_pal
+                self.idxs_layer.invalidate()
+                self.highlight_layer.invalidate()
                 self.update(x//0x10*0x10, y//0x10*0x10, 0x10, 0x10)
 
                 self.edited.emit(self.current_room, x//0x10*0x10, y//0x10*0x10)
@@ -185,6 +193,8 @@ class RoomEditWindow(QMainWindow):
         @Slot(int)
         def room_changed(self, room_idx):
             self.current_room = room_idx
+            self.idxs_layer.invalidate()
+            self.highlight_layer.invalidate()
             self.update(self.sceneRect())
 
             # Update objs display
@@ -193,6 +203,7 @@ class RoomEditWindow(QMainWindow):
         @Slot(int)
         def mt_select_changed(self, mt_idx):
             self.selected_mt = mt_idx
+            self.highlight_layer.invalidate()
             if self.highlight_same_mts:
                 self.update(self.sceneRect())
 
@@ -203,11 +214,13 @@ class RoomEditWindow(QMainWindow):
         @Slot(Qt.CheckState)
         def show_tile_idxs_toggled(self, state):
             self.show_tile_idxs = state == Qt.Checked
+            self.idxs_layer.invalidate()
             self.update(self.sceneRect())
 
         @Slot(Qt.CheckState)
         def show_mt_idxs_toggled(self, state):
             self.show_mt_idxs = state == Qt.Checked
+            self.idxs_layer.invalidate()
             self.update(self.sceneRect())
 
         @Slot(Qt.CheckState)
@@ -217,55 +230,46 @@ class RoomEditWindow(QMainWindow):
 
         @Slot(Qt.CheckState)
         def show_objs_toggled(self, state):
-            for obj in self.objs:
-                obj.setVisible(state == Qt.Checked)
+            self.obj_items.set_visible(state == Qt.Checked)
 
         @Slot(list)
         def obj_list_changed(self, objs):
-            # Update objs display
-            self.clear()
-            self.objs = []
-            for i, obj_data in enumerate(self.rooms_data[self.current_room]['objs']): # instead of enumerate(objs) due to a PySide6 bug
-                obj = ObjectGraphicsItem(obj_data, i)
-                self.addItem(obj)
-                self.objs.append(obj)
+            # Update objs display, only the items of added or removed objects change
+            self.objs = self.obj_items.sync(self.rooms_data[self.current_room]['objs']) # instead of objs due to a PySide6 bug
 
         @Slot(int)
         def obj_data_changed(self, idx):
             obj_data = self.objs[idx].obj_data
-            self.objs[idx].setPos(obj_data[1][1], obj_data[2][1])
+            self.objs[idx].setPos(obj_data.x, obj_data.y)
             self.objs[idx].update(self.objs[idx].boundingRect())
 
-        def area_changed(self, gfx, pals, metatile_data, rooms_data):
-            self.gfx = gfx
-            self.pals = pals
+            self.objs_edited.emit(self.current_room)
+
+        def obj_moved(self, idx):
+            self.objs_edited.emit(self.current_room)
+
+        def area_changed(self, area, metatile_data, rooms_data):
+            self.area = area
             self.metatile_data = metatile_data
             self.rooms_data = rooms_data
 
-            # Generate metatile images
-            self.mt_images = []
-            pal = convert_palette(put_palette_strings(pals[0]), 'src/palette.pal', transparent=False)
-            for pal_idx in range(4):
-                mts_per_pal = []
-                for i in range(0x100):
-                    mts_per_pal.append(gfx_2_qimage(gfx, pal, width=2, idxs=metatile_data[i*4:i*4+4], pal_per_tile=[pal_idx]*4))
-                self.mt_images.append(mts_per_pal)
-
             self.current_room = 0
+            self.idxs_layer.invalidate()
+            self.highlight_layer.invalidate()
             self.update(self.sceneRect())
 
             # Objects display
             self.obj_list_changed(self.rooms_data[self.current_room]['objs'])
 
-        def colors_changed(self, pals):
-            self.area_changed(self.gfx, pals, self.metatile_data, self.rooms_data)
-
-        def metatile_edited(self, mt_idx):
-            pal = convert_palette(put_palette_strings(self.pals[0]), 'src/palette.pal', transparent=False)
-            for pal_idx in range(4):
-                self.mt_images[pal_idx][mt_idx] = gfx_2_qimage(self.gfx, pal, width=2, idxs=self.metatile_data[mt_idx*4:mt_idx*4+4], pal_per_tile=[pal_idx]*4)
+        def colors_changed(self):
             self.update(self.sceneRect())
 
+        def metatile_edited(self, usages):
+            for room_idx, mt_loc in usages:
+                if room_idx == self.current_room:
+                    self.idxs_layer.invalidate()
+                    self.update(mt_loc%0x10*0x10, mt_loc//0x10*0x10, 0x10, 0x10)
+
     class RoomEditView(QGraphicsView):
         def __init__(self, scene, parent=None):
             super().__init__(parent)
@@ -276,7 +280,7 @@ class RoomEditWindow(QMainWindow):
 
     new_room_added = Signal()
 
-    def __init__(self, gfx, pals, metatile_data, rooms_data, obj_types, parent=None):
+    def __init__(self, area, mt_images, metatile_data, rooms_data, obj_types, parent=None):
         super().__init__(parent)
 
         self.rooms_data = rooms_data
@@ -284,7 +288,7 @@ class RoomEditWindow(QMainWindow):
         self.current_room = 0
 
         # Metatile column
-        self.mt_select = self.MetatileSelect(gfx, pals, metatile_data)
+        self.mt_select = self.MetatileSelect(area, mt_images, metatile_data)
         self.mt_select_view = self.MetatileSelectView(self.mt_select)
         self.pal_select = QSpinBox(minimum=0, maximum=3)
         self.show_tile_idxs_toggle = QCheckBox()
@@ -301,7 +305,7 @@ class RoomEditWindow(QMainWindow):
         self.room_select_form = QFormLayout()
         self.room_select_form.addRow('Room', self.room_select)
         self.new_room_button = QPushButton('New room')
-        self.room_edit = self.RoomEdit(gfx, pals, metatile_data, self.rooms_data)
+        self.room_edit = self.RoomEdit(area, mt_images, metatile_data, self.rooms_data)
         self.room_edit_view = self.RoomEditView(self.room_edit)
         self.show_mt_idxs_toggle = QCheckBox()
         self.highlight_same_mts_toggle = QCheckBox()
@@ -377,8 +381,8 @@ class RoomEditWindow(QMainWindow):
     @Slot()
     def new_room_button_clicked(self):
         self.rooms_data.append({
-            'tilemap': [0xFF]*0xF0,
-            'attrs': [0]*0x100,
+            'tilemap': np.full(0xF0, 0xFF, dtype=np.uint8),
+            'attrs': np.zeros(0x100, dtype=np.uint8),
             'objs': []
         })
         self.room_select.setMaximum(len(self.rooms_data)-1)
@@ -396,6 +400,8 @@ class RoomEditWindow(QMainWindow):
             self.obj_props_model = None
         self.obj_props_table.setModel(self.obj_props_model)
 
+        self.room_edit.objs_edited.emit(self.current_room)
+
     @Slot(QModelIndex)
     def obj_list_pressed(self, index):
         self.obj_props_model = ObjPropsModel(self.rooms_data[self.current_room]['objs'][index.row()], index.row(), self.obj_types)
@@ -403,7 +409,7 @@ class RoomEditWindow(QMainWindow):
 
         self.obj_props_model.changed.connect(self.room_edit.obj_data_changed)
 
-    def area_changed(self, gfx, pals, metatile_data, rooms_data):
+    def area_changed(self, area, metatile_data, rooms_data):
         self.rooms_data = rooms_data
 
         self.pal_select.setValue(0)
@@ -411,15 +417,15 @@ class RoomEditWindow(QMainWindow):
         self.room_select.setValue(0)
         self.room_select.setMaximum(len(rooms_data)-1)
 
-        self.mt_select.area_changed(gfx, pals, metatile_data)
-        self.room_edit.area_changed(gfx, pals, metatile_data, rooms_data)
+        self.mt_select.area_changed(area, metatile_data)
+        self.room_edit.area_changed(area, metatile_data, rooms_data)
 
         self.room_changed(0)
 
-    def colors_changed(self, pals):
-        self.mt_select.colors_changed(pals)
-        self.room_edit.colors_changed(pals)
+    def colors_changed(self):
+        self.mt_select.colors_changed()
+        self.room_edit.colors_changed()
 
-    def metatile_edited(self, mt_idx, corner):
+    def metatile_edited(self, mt_idx, corner, usages):
         self.mt_select.metatile_edited(mt_idx)
-        self.room_edit.metatile_edited(mt_idx)
+        self.room_edit.metatile_edited(usages)
@@ -0,0 +1,93 @@
+''' Binary snapshot of an area's rooms and global objects, so loading it doesn't have to parse rooms.json and global_objs.json.
+The JSON files stay the source of truth: a snapshot is only used while their size and modification time match the ones it was made from '''
+from src.obj_record import ObjRecord
+import numpy as np
+import itertools, os, zipfile
+
+VERSION = 1
+ROOM_KEYS = ['tilemap', 'attrs', 'objs']
+
+def source_paths(folder_path, area):
+    return [os.path.join(folder_path, f'{area}/{name}') for name in ('rooms.json', 'global_objs.json')]
+
+def source_stats(paths):
+    stats = [os.stat(path) for path in paths]
+    return np.array([(stat.st_size, stat.st_mtime_ns) for stat in stats], dtype=np.int64).reshape(-1, 2)
+
+def save_snapshot(path, folder_path, area, rooms, global_objs):
+    '''Writes a snapshot of an area's rooms and global objects, taken right after saving them to JSON.
+    Objects are stored as flat lists of (name, value) props.
+    Returns False without writing anything if the data has something the snapshot format doesn't handle'''
+    if any(list(room) != ROOM_KEYS or len(room['tilemap']) != 0xF0 or len(room['attrs']) != 0x100 for room in rooms):
+        return False
+
+    # Objects of every room, then the global objects
+    objs = [obj for room in rooms for obj in room['objs']]+global_objs
+
+    strings = {}
+    prop_counts = []
+    prop_names = []
+    prop_values = []
+    prop_value_is_str = []
+    for obj in objs:
+        prop_counts.append(len(obj))
+        for prop_name, prop in obj:
+            prop_names.append(strings.setdefault(prop_name, len(strings)))
+            if isinstance(prop, str):
+                prop_values.append(strings.setdefault(prop, len(strings)))
+                prop_value_is_str.append(True)
+            elif isinstance(prop, int) and not isinstance(prop, bool):
+                prop_values.append(prop)
+                prop_value_is_str.append(False)
+            else:
+                return False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path+'.part', 'wb') as f:
+        np.savez(f,
+            version=np.array([VERSION]),
+            sources=source_stats(source_paths(folder_path, area)),
+            tilemaps=np.array([room['tilemap'] for room in rooms], dtype=np.uint8).reshape(-1, 0xF0),
+            attrs=np.array([room['attrs'] for room in rooms], dtype=np.uint8).reshape(-1, 0x100),
+            room_obj_counts=np.array([len(room['objs']) for room in rooms], dtype=np.int32),
+            strings=np.array(list(strings), dtype=str),
+            prop_counts=np.array(prop_counts, dtype=np.int32),
+            prop_names=np.array(prop_names, dtype=np.int32),
+            prop_values=np.array(prop_values, dtype=np.int64),
+            prop_value_is_str=np.array(prop_value_is_str, dtype=bool))
+    os.replace(path+'.part', path)
+    return True
+
+def load_snapshot(path, folder_path, area):
+    '''An area's rooms and global objects from its snapshot, in the same form as they're loaded from JSON.
+    None if there's no snapshot or it's out of date'''
+    try:
+        with np.load(path, allow_pickle=False) as snapshot:
+            if snapshot['version'].tolist() != [VERSION]:
+                return None
+            if not np.array_equal(snapshot['sources'], source_stats(source_paths(folder_path, area))):
+                return None
+
+            # Rooms get views into these, which are freshly loaded and writable
+            tilemaps = snapshot['tilemaps']
+            attrs = snapshot['attrs']
+            room_obj_counts = snapshot['room_obj_counts'].tolist()
+            strings = snapshot['strings'].tolist()
+            prop_names = [strings[i] for i in snapshot['prop_names'].tolist()]
+            prop_values = [strings[value] if is_str else value for value, is_str in zip(snapshot['prop_values'].tolist(), snapshot['prop_value_is_str'].tolist())]
+            props = list(zip(prop_names, prop_values))
+            prop_ends = list(itertools.accumulate(snapshot['prop_counts'].tolist()))
+            objs = [ObjRecord.from_items(props[start:end]) for start, end in zip([0]+prop_ends, prop_ends)]
+
+            rooms = []
+            obj_i = 0
+            for room_i, obj_count in enumerate(room_obj_counts):
+                rooms.append({
+                    'tilemap': tilemaps[room_i],
+                    'attrs': attrs[room_i],
+                    'objs': objs[obj_i:obj_i+obj_count]
+                })
+                obj_i += obj_count
+            return rooms, objs[obj_i:]
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
@@ -2,20 +2,31 @@ import numpy as np
 from PySide6.QtGui import QImage
 
 def gfx_2_qimage(gfx, palette, width=0x10, idxs=None, pal_per_tile=None):
-    if pal_per_tile == None:
-        pal_per_tile = [0]*(len(gfx)//0x10)
-
-    tiles = []
-    for n, i in enumerate(range(len(gfx)//0x10) if idxs == None else idxs):
-        tile = convert_tile_from_bitplanes(gfx[i*0x10:i*0x10+0x10])
-        tiles.append(tile + np.full((8, 8), pal_per_tile[n]*4, dtype=np.uint8))
-    while len(tiles) % width != 0:
-        tiles.append(np.zeros((8, 8), dtype=np.uint8))
-    rows = []
-    for row_i in range(len(tiles)//width):
-        rows.append(np.concatenate(tiles[row_i*width:row_i*width+width], 1))
-
-    image = QImage(np.ravel(np.concatenate(rows, 0)), width*8, len(tiles)//width*8, QImage.Format_Indexed8)
+    return tiles_2_qimage(convert_tiles_from_bitplanes(gfx, idxs), palette, width, pal_per_tile=pal_per_tile)
+
+def tiles_2_qimage(tiles, palette, width=0x10, idxs=None, pal_per_tile=None):
+    '''Same as gfx_2_qimage, but for tiles already decoded by convert_tiles_from_bitplanes'''
+    return pixels_2_qimage(compose_tiles(tiles, width, idxs, pal_per_tile), palette)
+
+def compose_tiles(tiles, width=0x10, idxs=None, pal_per_tile=None):
+    '''Lays out decoded tiles width tiles per row as one Indexed8 pixel buffer.
+    pal_per_tile is either a single palette or one palette per tile'''
+    if idxs is None:
+        idxs = np.arange(len(tiles))
+    else:
+        idxs = np.asarray(idxs, dtype=np.intp)
+    pals = np.asarray(0 if pal_per_tile is None else pal_per_tile, dtype=np.uint8)
+    if pals.ndim > 0:
+        pals = pals[:len(idxs)]
+    rows = -(-len(idxs)//width)
+
+    composed = np.zeros((rows*width, 8, 8), dtype=np.uint8)
+    composed[:len(idxs)] = tiles[idxs] + (pals*4)[..., np.newaxis, np.newaxis]
+    return np.ascontiguousarray(composed.reshape(rows, width, 8, 8).swapaxes(1, 2)).reshape(rows*8, width*8)
+
+def pixels_2_qimage(pixels, palette):
+    '''Wraps an Indexed8 pixel buffer in a QImage without copying it (the image keeps the buffer alive)'''
+    image = QImage(pixels, pixels.shape[1], pixels.shape[0], pixels.strides[0], QImage.Format_Indexed8)
     image.setColorTable(palette)
     return image
 
@@ -35,11 +46,7 @@ def add_to_canvas_from_spritemap(canvas, tilemaps, graphics):
         v_flip = tilemap['v_flip']
 
         def draw_tile_to_canvas(new_x_offset, new_y_offset, new_index):
-            tile_to_write = convert_tile_from_bitplanes(graphics[new_index*16+0x1000:new_index*16+0x1010])
-            if h_flip:
-                tile_to_write = np.fliplr(tile_to_write)
-            if v_flip:
-                tile_to_write = np.flipud(tile_to_write)
+            tile_to_write = convert_tiles_from_bitplanes(graphics[new_index*16+0x1000:new_index*16+0x1010], h_flip=h_flip, v_flip=v_flip)[0]
             for (i, j), value in np.ndenumerate(tile_to_write):
                 if value != 0:  # if not transparent
                     canvas[(new_x_offset + j, new_y_offset + i)] = palette * 4 + int(value)
@@ -89,6 +96,20 @@ def convert_tile_from_bitplanes(raw_tile):
     returnvalue = fixed_bits.reshape(8, 8)
     return returnvalue
 
+def convert_tiles_from_bitplanes(gfx, idxs=None, h_flip=False, v_flip=False):
+    '''Decodes a whole bank of 2bpp tiles (bytes, bytearray, memoryview or ndarray) at once.
+    Returns an (N, 8, 8) uint8 array, or one tile per entry of idxs if given'''
+    raw = np.frombuffer(gfx, dtype=np.uint8, count=len(gfx)//0x10*0x10).reshape(-1, 2, 8)
+    if idxs is not None:
+        raw = raw[np.asarray(idxs, dtype=np.intp)]
+
+    # (N, plane, row) bytes -> (N, plane, row, col) bits; little bit order reads the columns right to left
+    bits = np.unpackbits(raw[:, :, :, np.newaxis], axis=3, bitorder='little' if h_flip else 'big')
+    tiles = bits[:, 0] | (bits[:, 1] << 1)
+    if v_flip:
+        tiles = tiles[:, ::-1]
+    return np.ascontiguousarray(tiles)
+
 if __name__ == '__main__':
     import base64, json
     from pal_utils import convert_palette, put_palette_strings